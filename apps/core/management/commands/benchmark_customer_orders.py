@@ -0,0 +1,206 @@
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from services.wordpress_service import WordPressService, PAYMENT_META_KEYS
+from services.wordpress_records import Order, Installment
+from services.db_instrumentation import start_query_collection, stop_query_collection
+
+
+def legacy_structure_customer_orders(email, order_graph):
+    """
+    Estructuración anterior de get_customer_orders_structured: mismo resultado que
+    WordPressService._structure_customer_orders, pero clasifica el método de pago
+    recorriendo todas las claves de metadatos de cada cuota con los prefijos '_stripe_'
+    y '_dlocal_'. Se conserva solo como referencia para comparar.
+    """
+    structured_orders = []
+    all_installments = []
+    installment_index = {}
+    payment_methods = {'stripe': False, 'dlocal': False, 'other': False}
+
+    for order_group in order_graph:
+        parent_order = order_group['parent_order']
+        installments = order_group['installments']
+
+        for installment in installments:
+            all_installments.append(installment)
+            installment_index.setdefault((parent_order['id'], installment['payment_number']), installment)
+            metadata = installment['metadata_dict']
+
+            has_stripe = any(key.startswith('_stripe_') for key in metadata.keys())
+            has_dlocal = any(key.startswith('_dlocal_') for key in metadata.keys())
+
+            if has_stripe:
+                payment_methods['stripe'] = True
+            elif has_dlocal:
+                payment_methods['dlocal'] = True
+            else:
+                payment_methods['other'] = True
+
+        structured_orders.append({
+            'parent_order': parent_order,
+            'installments': installments,
+            'installments_count': len(installments)
+        })
+
+    primary_payment_method = 'unknown'
+    if payment_methods['dlocal']:
+        primary_payment_method = 'dlocal'
+    elif payment_methods['stripe']:
+        primary_payment_method = 'stripe'
+    elif payment_methods['other']:
+        primary_payment_method = 'other'
+
+    return {
+        'success': True,
+        'email': email,
+        'structured_orders': structured_orders,
+        'installment_index': installment_index,
+        'summary': {
+            'parent_orders_count': len(structured_orders),
+            'total_installments': len(all_installments),
+            'payment_methods': payment_methods,
+            'primary_payment_method': primary_payment_method
+        }
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Micro-benchmark del costo por cliente de armar las órdenes estructuradas: compara la '
+        'estructuración anterior (clasificación por todas las claves de metadatos) con la actual '
+        '(solo las claves relevantes) sobre el mismo grafo sintético y el mismo resultado y, con '
+        '--email, mide la ruta completa contra la base de datos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--plans',
+            type=int,
+            default=3,
+            help='Órdenes madre por cliente del grafo sintético (por defecto 3)'
+        )
+        parser.add_argument(
+            '--installments',
+            type=int,
+            default=12,
+            help='Cuotas por orden madre (por defecto 12)'
+        )
+        parser.add_argument(
+            '--meta-keys',
+            type=int,
+            default=40,
+            help='Metadatos por cuota, como al cargar sin proyección (por defecto 40)'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=2000,
+            help='Repeticiones por medición (por defecto 2000)'
+        )
+        parser.add_argument(
+            '--email',
+            type=str,
+            help='Medir además get_customer_orders_structured sin caché para este cliente'
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations debe ser mayor que 0')
+
+        wp_service = WordPressService()
+        order_graph = self._build_synthetic_graph(options['plans'], options['installments'], options['meta_keys'])
+        iterations = options['iterations']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Grafo sintético: {options['plans']} planes × {options['installments']} cuotas × "
+            f"{options['meta_keys']} metadatos, {iterations} repeticiones"
+        ))
+
+        email = 'benchmark@example.com'
+        legacy_us = self._time_per_call(lambda: legacy_structure_customer_orders(email, order_graph), iterations)
+        current_us = self._time_per_call(lambda: wp_service._structure_customer_orders(email, order_graph), iterations)
+
+        legacy_result = legacy_structure_customer_orders(email, order_graph)
+        current_result = wp_service._structure_customer_orders(email, order_graph)
+        if legacy_result != current_result:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  Resultado distinto: antes {legacy_result['summary']}, ahora {current_result['summary']}"
+            ))
+
+        self.stdout.write(f"Estructuración anterior: {legacy_us:.1f} µs/cliente")
+        self.stdout.write(f"Estructuración actual:   {current_us:.1f} µs/cliente")
+        if current_us:
+            self.stdout.write(self.style.SUCCESS(f"✅ {legacy_us / current_us:.1f}x"))
+
+        if options['email']:
+            self._benchmark_email(wp_service, options['email'], max(1, min(iterations, 20)))
+
+    def _benchmark_email(self, wp_service, email, iterations):
+        """
+        Mide la ruta completa (consultas + estructuración) sin memo ni caché de snapshots.
+        """
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Ruta completa para {email} ({iterations} repeticiones)"))
+
+        stats, token = start_query_collection()
+        try:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                result = wp_service._build_customer_orders_structured(email, PAYMENT_META_KEYS)
+                if not result['success']:
+                    raise CommandError(f"Error consultando órdenes: {result['error']}")
+            elapsed = time.perf_counter() - start
+        finally:
+            stop_query_collection(token)
+
+        summary = result['summary']
+        self.stdout.write(
+            f"{summary['parent_orders_count']} planes, {summary['total_installments']} cuotas, "
+            f"método principal {summary['primary_payment_method']}"
+        )
+        self.stdout.write(
+            f"{elapsed / iterations * 1000:.2f} ms/cliente, {stats.query_count / iterations:.0f} consultas/cliente "
+            f"({stats.total_time / iterations * 1000:.2f} ms en MySQL)"
+        )
+
+    def _time_per_call(self, func, iterations):
+        func()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - start) / iterations * 1_000_000
+
+    def _build_synthetic_graph(self, plans, installments, meta_keys):
+        """
+        Grafo madre → cuotas con metadatos de relleno típicos de WooCommerce y las claves
+        de Stripe al final, el peor caso para el recorrido por prefijos.
+        """
+        created = datetime(2024, 1, 1)
+        filler_keys = [f'_wc_filler_meta_{index}' for index in range(max(0, meta_keys - 4))]
+        order_graph = []
+        order_id = 1
+
+        for _ in range(plans):
+            parent_order = Order(order_id, 'wc-active', created, 'benchmark@example.com', Decimal('100.00'),
+                                 'stripe', 'Stripe', 'asp_shop_plan')
+            order_id += 1
+            plan_installments = []
+            for payment_number in range(1, installments + 1):
+                metadata = {key: 'x' for key in filler_keys}
+                metadata.update({
+                    '_asp_upp_payment_number': str(payment_number),
+                    '_asp_upp_schedule_payment': str(parent_order.id),
+                    '_stripe_customer_id': 'cus_benchmark',
+                    '_stripe_source_id': 'pm_benchmark',
+                })
+                plan_installments.append(Installment(
+                    order_id, 'wc-processing', created + timedelta(days=30 * payment_number),
+                    'benchmark@example.com', Decimal('30.00'), 'stripe', 'Stripe', 'shop_order',
+                    metadata_dict=metadata, parent_order_id=parent_order.id
+                ))
+                order_id += 1
+            order_graph.append({'parent_order': parent_order, 'installments': plan_installments})
+
+        return order_graph
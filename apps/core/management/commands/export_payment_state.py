@@ -0,0 +1,122 @@
+import csv
+import json
+import os
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from services.wordpress_service import WordPressService, PAYMENT_STATE_FIELDS
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta el estado de pago de todos los planes (asp_shop_plan) a CSV o JSONL: método '
+        'actual, IDs de Stripe/dLocal y cuotas con _stripe_source_id desactualizado. Lee las '
+        'órdenes con un cursor del lado del servidor en memoria constante y guarda un punto de '
+        'control tras cada lote para poder reanudar con --resume'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str, help='Archivo de salida (.csv o .jsonl)')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Formato de salida (por defecto según la extensión del archivo; csv si no se reconoce)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Planes por lote y por punto de control (por defecto 500)'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continuar una exportación interrumpida desde su punto de control'
+        )
+
+    def handle(self, *args, **options):
+        output = options['output']
+        checkpoint_path = f"{output}.checkpoint"
+        output_format = options['format'] or ('jsonl' if output.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        checkpoint = {'last_parent_id': 0, 'rows_written': 0, 'output_size': 0, 'format': output_format}
+        if options['resume']:
+            checkpoint = self._read_checkpoint(checkpoint_path)
+            if checkpoint['format'] != output_format:
+                raise CommandError(f"La exportación interrumpida es {checkpoint['format']}, no {output_format}")
+
+        wp_service = WordPressService()
+        total = checkpoint['rows_written'] + wp_service.count_plan_orders(checkpoint['last_parent_id'])
+        self.stdout.write(
+            f"Exportando {total} planes a {output} ({output_format})"
+            + (f", reanudando después de la orden {checkpoint['last_parent_id']}" if options['resume'] else '')
+        )
+
+        method_counts = Counter()
+        stale_plans = 0
+        started_at = time.monotonic()
+        exported_now = 0
+
+        with open(output, 'r+' if options['resume'] else 'w', newline='', encoding='utf-8') as output_file:
+            # Descartar lo escrito después del último punto de control
+            output_file.seek(checkpoint['output_size'])
+            output_file.truncate()
+
+            writer = None
+            if output_format == 'csv':
+                writer = csv.DictWriter(output_file, fieldnames=PAYMENT_STATE_FIELDS)
+                if not options['resume']:
+                    writer.writeheader()
+
+            for states in wp_service.iter_payment_states(checkpoint['last_parent_id'], options['batch_size']):
+                for state in states:
+                    if writer:
+                        writer.writerow(state)
+                    else:
+                        output_file.write(json.dumps(state, default=str) + '\n')
+                    method_counts[state['payment_method']] += 1
+                    if state['stale_source_id_installments']:
+                        stale_plans += 1
+
+                output_file.flush()
+                os.fsync(output_file.fileno())
+
+                exported_now += len(states)
+                checkpoint.update({
+                    'last_parent_id': states[-1]['parent_order_id'],
+                    'rows_written': checkpoint['rows_written'] + len(states),
+                    'output_size': output_file.tell()
+                })
+                self._write_checkpoint(checkpoint_path, checkpoint)
+
+                elapsed = time.monotonic() - started_at
+                percent = (checkpoint['rows_written'] / total * 100) if total else 100
+                self.stdout.write(
+                    f"  {checkpoint['rows_written']}/{total} planes ({percent:.1f}%), "
+                    f"{exported_now / elapsed if elapsed else 0:.0f} planes/s"
+                )
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Exportados {checkpoint['rows_written']} planes a {output}"))
+        if method_counts:
+            summary = ', '.join(f"{method}: {count}" for method, count in method_counts.most_common())
+            self.stdout.write(f"Métodos de pago (esta ejecución): {summary}")
+            self.stdout.write(f"Planes con _stripe_source_id desactualizado (esta ejecución): {stale_plans}")
+
+    def _read_checkpoint(self, checkpoint_path):
+        try:
+            with open(checkpoint_path, encoding='utf-8') as checkpoint_file:
+                return json.load(checkpoint_file)
+        except FileNotFoundError:
+            raise CommandError(f"No hay punto de control en {checkpoint_path}; ejecuta sin --resume")
+
+    def _write_checkpoint(self, checkpoint_path, checkpoint):
+        # Escritura atómica: un corte a mitad nunca deja un punto de control corrupto
+        temp_path = f"{checkpoint_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, checkpoint_path)
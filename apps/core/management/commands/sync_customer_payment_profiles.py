@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from services.wordpress_service import WordPressService
+
+
+class Command(BaseCommand):
+    help = (
+        'Sincroniza la tabla local de perfiles de pago (CustomerPaymentProfile) con los clientes '
+        'cuyas órdenes de WordPress cambiaron desde la última ejecución. Pensado para ejecutarse '
+        'periódicamente (cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Ignorar la marca de agua y recorrer todas las órdenes'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Órdenes modificadas por lote (por defecto 500)'
+        )
+
+    def handle(self, *args, **options):
+        wp_service = WordPressService()
+        result = wp_service.sync_customer_payment_profiles(
+            batch_size=options['batch_size'],
+            full=options['full']
+        )
+
+        if not result['success']:
+            raise CommandError(f"❌ Error: {result['error']}")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {result['message']}"))
+        for email in result['failed_emails']:
+            self.stdout.write(self.style.WARNING(f"⚠️  No se pudo sincronizar {email}"))
+        if result['high_water_mark']:
+            self.stdout.write(f"Marca de agua: {result['high_water_mark'].isoformat()}")
@@ -0,0 +1,242 @@
+import pymysql
+from django.core.management.base import BaseCommand, CommandError
+from services.wordpress_service import WordPressService, PAYMENT_META_KEYS, METADATA_BATCH_SIZE
+from services.db_instrumentation import fingerprint, start_query_collection, stop_query_collection
+from core.models import SyncState
+
+
+# Índices que necesitan las consultas de WordPressService. Las columnas de texto largo
+# llevan longitud de prefijo (meta_value es LONGTEXT y no admite índice completo).
+RECOMMENDED_INDEXES = [
+    {
+        'table': 'wp_wc_orders_meta',
+        'name': 'cp_meta_key_value',
+        'columns': [('meta_key', 100), ('meta_value', 32)],
+        'reason': 'Búsqueda de cuotas por meta_key IN (...) AND meta_value = ID de la orden madre'
+    },
+    {
+        'table': 'wp_wc_orders_meta',
+        'name': 'cp_order_id_meta_key',
+        'columns': [('order_id', None), ('meta_key', 100)],
+        'reason': 'Carga de metadatos por order_id IN (...) y actualización de metadatos'
+    },
+    {
+        'table': 'wp_wc_orders',
+        'name': 'cp_billing_email_type',
+        'columns': [('billing_email', 100), ('type', None)],
+        'reason': 'Órdenes madre por billing_email AND type = asp_shop_plan'
+    },
+    {
+        'table': 'wp_wc_orders',
+        'name': 'cp_date_updated_id',
+        'columns': [('date_updated_gmt', None), ('id', None)],
+        'reason': 'Recorrido incremental de sync_installment_links y verificación de la tabla local de cuotas por (date_updated_gmt, id)'
+    },
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta EXPLAIN sobre las sentencias que emite WordPressService para un cliente, '
+        'reporta los escaneos completos y sugiere (o crea con --create) los índices que faltan'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'email',
+            type=str,
+            help='Email de un cliente real con órdenes, para ejecutar las consultas con datos representativos'
+        )
+        parser.add_argument(
+            '--create',
+            action='store_true',
+            help='Crear en la base de datos primaria los índices sugeridos que falten'
+        )
+
+    def handle(self, *args, **options):
+        email = options['email']
+        wp_service = WordPressService()
+
+        statements = self._capture_statements(wp_service, email)
+        if not statements:
+            raise CommandError('No se capturó ninguna sentencia. Verifica la conexión y el email.')
+
+        connection = wp_service._get_connection()
+        try:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                full_scan_tables = self._explain_statements(cursor, statements)
+
+                self.stdout.write('')
+                self.stdout.write(self.style.MIGRATE_HEADING('Índices recomendados'))
+                missing = []
+                for index in RECOMMENDED_INDEXES:
+                    if self._has_equivalent_index(cursor, index):
+                        self.stdout.write(self.style.SUCCESS(f"✅ {index['table']}.{index['name']}: cubierto por un índice existente"))
+                        continue
+                    missing.append(index)
+                    priority = ' (tabla con escaneo completo)' if index['table'] in full_scan_tables else ''
+                    self.stdout.write(self.style.WARNING(f"⚠️  {index['table']}.{index['name']}: falta{priority}"))
+                    self.stdout.write(f"    {index['reason']}")
+                    self.stdout.write(f"    {self._create_index_sql(index)};")
+
+            if options['create'] and missing:
+                self._create_indexes(connection, missing)
+            elif missing:
+                self.stdout.write('')
+                self.stdout.write('Ejecuta de nuevo con --create para crear los índices que faltan.')
+        finally:
+            connection.close()
+
+    def _capture_statements(self, wp_service, email):
+        """
+        Ejecuta las lecturas que emite WordPressService para el email (vistas, tabla local
+        de cuotas y rutas de escritura), sin caché, y devuelve la primera sentencia de cada
+        huella con sus parámetros. Las sentencias de escritura
+        no se ejecutan: se arman aquí (ver _write_statements) para pasarlas a EXPLAIN.
+        """
+        stats, token = start_query_collection(capture_statements=True)
+        try:
+            # Lectura de la vista (tabla local de cuotas si está fresca y verificada)
+            structured_result = wp_service._build_customer_orders_structured(email, PAYMENT_META_KEYS)
+            if not structured_result['success']:
+                raise CommandError(f"Error consultando órdenes: {structured_result['error']}")
+
+            wp_service._query_current_payment_method(email, PAYMENT_META_KEYS)
+
+            order_ids = []
+            for order_group in structured_result['structured_orders']:
+                order_ids.append(order_group['parent_order']['id'])
+                order_ids.extend(installment['id'] for installment in order_group['installments'])
+
+            if order_ids:
+                connection = wp_service._get_connection(read_only=True)
+                try:
+                    with connection.cursor() as cursor:
+                        # Cuotas por los metadatos de enlace: sin tabla local y en la
+                        # selección de órdenes de update_stripe_source_id_for_customer
+                        wp_service._load_order_graphs(
+                            cursor, [email.strip().lower()], (), use_installment_links=False
+                        )
+                        # Cuotas por la tabla local: órdenes modificadas desde la marca de agua
+                        # y carga por ID
+                        wp_service._get_installment_links_changed_since(cursor, SyncState(high_water_mark_id=0))
+                        wp_service._load_order_rows_by_id(cursor, order_ids)
+                        # Emails afectados por una escritura sin email explícito
+                        wp_service._get_order_emails(cursor, order_ids)
+                finally:
+                    connection.close()
+            else:
+                self.stdout.write(self.style.WARNING('El cliente no tiene órdenes: solo se analizan las consultas de lectura iniciales'))
+        finally:
+            stop_query_collection(token)
+
+        statements = dict(stats.statements)
+        if order_ids:
+            statements.update(self._write_statements(order_ids))
+        return statements
+
+    def _write_statements(self, order_ids):
+        """
+        Sentencias de update_order_meta y bulk_update_order_meta para las órdenes del
+        cliente, con la misma forma que las que emite WordPressService. Solo se usan con
+        EXPLAIN: el SELECT se arma sin FOR UPDATE y nada se ejecuta ni se bloquea.
+        """
+        meta_key = '_stripe_source_id'
+        meta_value = 'index-advisor'
+        chunk = order_ids[:METADATA_BATCH_SIZE]
+        placeholders = ','.join(['%s'] * len(chunk))
+
+        statements = [
+            # update_order_meta
+            ("""
+                SELECT id FROM wp_wc_orders_meta
+                WHERE order_id = %s AND meta_key = %s
+            """, [order_ids[0], meta_key]),
+            ("""
+                UPDATE wp_wc_orders_meta
+                SET meta_value = %s
+                WHERE order_id = %s AND meta_key = %s
+            """, [meta_value, order_ids[0], meta_key]),
+            # bulk_update_order_meta / update_stripe_source_id_for_customer
+            (f"""
+                SELECT order_id, meta_value FROM wp_wc_orders_meta
+                WHERE meta_key = %s AND order_id IN ({placeholders})
+                ORDER BY order_id, id
+            """, [meta_key] + chunk),
+            (f"""
+                UPDATE wp_wc_orders_meta
+                SET meta_value = %s
+                WHERE meta_key = %s AND order_id IN ({placeholders})
+            """, [meta_value, meta_key] + chunk),
+        ]
+        return {fingerprint(sql): (sql, params) for sql, params in statements}
+
+    def _explain_statements(self, cursor, statements):
+        """
+        Ejecuta EXPLAIN sobre cada sentencia y muestra el plan resumido.
+
+        Returns:
+            Conjunto de tablas con escaneo completo en alguna sentencia
+        """
+        full_scan_tables = set()
+
+        for statement_fingerprint, (sql, params) in statements.items():
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(statement_fingerprint))
+            try:
+                cursor.execute(f"EXPLAIN {sql}", params)
+                plan = cursor.fetchall()
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"❌ No se pudo ejecutar EXPLAIN: {str(e)}"))
+                continue
+
+            for row in plan:
+                access_type = row.get('type')
+                table = row.get('table')
+                key = row.get('key')
+                line = (f"  {table}: type={access_type} key={key or '-'} "
+                        f"rows={row.get('rows')} extra={row.get('Extra') or '-'}")
+
+                if access_type == 'ALL' or (access_type == 'index' and table):
+                    full_scan_tables.add(table)
+                    self.stdout.write(self.style.ERROR(f"❌{line} (escaneo completo)"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"✅{line}"))
+
+        return full_scan_tables
+
+    def _has_equivalent_index(self, cursor, index):
+        """
+        Indica si ya existe un índice cuyas primeras columnas coinciden, en orden,
+        con las del índice recomendado.
+        """
+        cursor.execute(f"SHOW INDEX FROM {index['table']}")
+        existing = {}
+        for row in cursor.fetchall():
+            existing.setdefault(row['Key_name'], []).append((row['Seq_in_index'], row['Column_name']))
+
+        wanted = [column for column, _ in index['columns']]
+        for columns in existing.values():
+            ordered = [column for _, column in sorted(columns)]
+            if ordered[:len(wanted)] == wanted:
+                return True
+        return False
+
+    def _create_index_sql(self, index):
+        columns = ', '.join(
+            f"{column}({length})" if length else column
+            for column, length in index['columns']
+        )
+        return f"ALTER TABLE {index['table']} ADD INDEX {index['name']} ({columns})"
+
+    def _create_indexes(self, connection, indexes):
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING('Creando índices'))
+        with connection.cursor() as cursor:
+            for index in indexes:
+                sql = self._create_index_sql(index)
+                try:
+                    cursor.execute(sql)
+                    self.stdout.write(self.style.SUCCESS(f"✅ {sql}"))
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"❌ {sql}: {str(e)}"))
@@ -0,0 +1,93 @@
+import logging
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from services.db_instrumentation import (
+    start_query_collection, stop_query_collection, start_deadline, stop_deadline
+)
+
+logger = logging.getLogger('conquerpass.db')
+
+
+class WordPressQueryStatsMiddleware:
+    """
+    Recolecta las consultas a WordPress de cada request y registra un resumen
+    (cantidad de consultas y tiempo total en base de datos).
+    El resumen queda disponible en request.wordpress_query_stats.
+    Funciona con vistas síncronas y asíncronas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats, token = start_query_collection()
+        request.wordpress_query_stats = stats
+        try:
+            return self.get_response(request)
+        finally:
+            stop_query_collection(token)
+            self._log_summary(request, stats)
+
+    async def __acall__(self, request):
+        # Las consultas corren en hilos (sync_to_async), que heredan una copia del
+        # contexto: todas registran en el mismo objeto QueryStats
+        stats, token = start_query_collection()
+        request.wordpress_query_stats = stats
+        try:
+            return await self.get_response(request)
+        finally:
+            stop_query_collection(token)
+            self._log_summary(request, stats)
+
+    def _log_summary(self, request, stats):
+        if stats.query_count:
+            summary = stats.summary()
+            # Nombre de la vista en lugar del path: el path lleva el email encriptado
+            view_name = getattr(request.resolver_match, 'view_name', None) or request.path
+            logger.info(
+                f"[DB] {request.method} {view_name}: {summary['query_count']} consultas, "
+                f"{summary['total_time_ms']} ms, {summary['total_rows']} filas, "
+                f"{summary['slow_query_count']} lentas"
+            )
+
+
+class WordPressDeadlineMiddleware:
+    """
+    Fija el presupuesto de tiempo de cada request para las consultas a WordPress
+    (WORDPRESS_REQUEST_DEADLINE). Agotado, WordPressService deja de consultar: falla
+    rápido con DeadlineExceeded o sirve el último snapshot conocido.
+    Funciona con vistas síncronas y asíncronas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.deadline_seconds = getattr(settings, 'WORDPRESS_REQUEST_DEADLINE', 20)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = start_deadline(self.deadline_seconds)
+        try:
+            return self.get_response(request)
+        finally:
+            stop_deadline(token)
+
+    async def __acall__(self, request):
+        # Los hilos de sync_to_async heredan una copia del contexto con el mismo límite
+        token = start_deadline(self.deadline_seconds)
+        try:
+            return await self.get_response(request)
+        finally:
+            stop_deadline(token)
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-15 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('high_water_mark', models.DateTimeField(blank=True, null=True)),
+                ('high_water_mark_id', models.BigIntegerField(default=0)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InstallmentLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parent_id', models.BigIntegerField()),
+                ('installment_id', models.BigIntegerField()),
+                ('payment_number', models.IntegerField(default=0)),
+                ('status', models.CharField(max_length=20)),
+                ('date_created_gmt', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['parent_id', 'payment_number'], name='core_link_parent_number_idx'), models.Index(fields=['installment_id'], name='core_link_installment_idx')],
+                'constraints': [models.UniqueConstraint(fields=('parent_id', 'installment_id'), name='core_installment_link_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-15 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerPaymentProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.CharField(max_length=254, unique=True)),
+                ('payment_method', models.CharField(max_length=20)),
+                ('stripe_customer_id', models.CharField(blank=True, max_length=255)),
+                ('stripe_source_id', models.CharField(blank=True, max_length=255)),
+                ('dlocal_plan_id', models.CharField(blank=True, max_length=255)),
+                ('dlocal_subscription_id', models.CharField(blank=True, max_length=255)),
+                ('parent_order_id', models.BigIntegerField(blank=True, null=True)),
+                ('latest_installment_id', models.BigIntegerField(blank=True, null=True)),
+                ('latest_installment_payment_number', models.IntegerField(blank=True, null=True)),
+                ('latest_installment_date', models.DateTimeField(blank=True, null=True)),
+                ('next_installment_id', models.BigIntegerField(blank=True, null=True)),
+                ('next_installment_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('parent_orders_count', models.IntegerField(default=0)),
+                ('total_installments', models.IntegerField(default=0)),
+                ('has_stripe', models.BooleanField(default=False)),
+                ('has_dlocal', models.BooleanField(default=False)),
+                ('stale', models.BooleanField(db_index=True, default=False)),
+                ('synced_at', models.DateTimeField()),
+            ],
+        ),
+    ]
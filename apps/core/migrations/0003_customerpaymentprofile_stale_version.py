@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-15 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_customerpaymentprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerpaymentprofile',
+            name='stale_version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,79 @@
+from django.db import models
+
+
+class SyncState(models.Model):
+    """
+    Marca de agua (high-water mark) de una sincronización incremental desde WordPress.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    high_water_mark_id = models.BigIntegerField(default=0)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.high_water_mark})"
+
+
+class InstallmentLink(models.Model):
+    """
+    Relación compacta cuota → orden madre copiada de wp_wc_orders_meta
+    ('_asp_upp_initial_payment' / '_asp_upp_schedule_payment'), para no escanear
+    los metadatos de WordPress al buscar las cuotas de un plan.
+    """
+    parent_id = models.BigIntegerField()
+    installment_id = models.BigIntegerField()
+    payment_number = models.IntegerField(default=0)
+    status = models.CharField(max_length=20)
+    date_created_gmt = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['parent_id', 'installment_id'], name='core_installment_link_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['parent_id', 'payment_number'], name='core_link_parent_number_idx'),
+            models.Index(fields=['installment_id'], name='core_link_installment_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.parent_id} → {self.installment_id} (#{self.payment_number})"
+
+
+class CustomerPaymentProfile(models.Model):
+    """
+    Estado de pago desnormalizado de un cliente, copiado de WordPress por
+    WordPressService.sync_customer_payment_profiles() para que la página de cambio
+    de método de pago se pueda mostrar leyendo una sola fila.
+    """
+    email = models.CharField(max_length=254, unique=True)  # normalizado en minúsculas
+    payment_method = models.CharField(max_length=20)  # stripe, dlocal o unknown
+    stripe_customer_id = models.CharField(max_length=255, blank=True)
+    stripe_source_id = models.CharField(max_length=255, blank=True)
+    dlocal_plan_id = models.CharField(max_length=255, blank=True)
+    dlocal_subscription_id = models.CharField(max_length=255, blank=True)
+
+    # Última cuota wc-processing y su orden madre
+    parent_order_id = models.BigIntegerField(null=True, blank=True)
+    latest_installment_id = models.BigIntegerField(null=True, blank=True)
+    latest_installment_payment_number = models.IntegerField(null=True, blank=True)
+    latest_installment_date = models.DateTimeField(null=True, blank=True)
+
+    # Cuota siguiente a la última wc-processing
+    next_installment_id = models.BigIntegerField(null=True, blank=True)
+    next_installment_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
+    # Resumen de órdenes
+    parent_orders_count = models.IntegerField(default=0)
+    total_installments = models.IntegerField(default=0)
+    has_stripe = models.BooleanField(default=False)
+    has_dlocal = models.BooleanField(default=False)
+
+    # Una escritura desde la aplicación deja el perfil desactualizado hasta la próxima sincronización.
+    # stale_version cuenta esas marcas: la sincronización solo limpia stale si no cambió
+    # desde que empezó a leer WordPress
+    stale = models.BooleanField(default=False, db_index=True)
+    stale_version = models.BigIntegerField(default=0)
+    synced_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.email} ({self.payment_method})"
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('circuit-breakers/', views.circuit_breakers_view, name='circuit_breakers'),
+]
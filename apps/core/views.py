@@ -0,0 +1,14 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from services.circuit_breaker import get_circuit_breakers_state
+
+
+@require_GET
+@staff_member_required
+def circuit_breakers_view(request):
+    """
+    Estado de los circuit breakers de dLocal y Stripe de este proceso (solo staff).
+    Cada worker tiene sus propios circuitos: el estado corresponde al que atendió el request.
+    """
+    return JsonResponse({'circuit_breakers': get_circuit_breakers_state()})
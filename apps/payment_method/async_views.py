@@ -0,0 +1,27 @@
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from .views import ChangePaymentMethodView, InitiateDLocalPaymentChangeView, PaymentServices
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChangePaymentMethodView(ChangePaymentMethodView):
+    """
+    Versión asíncrona de ChangePaymentMethodView para despliegues ASGI: las llamadas a
+    WordPress, Stripe y dLocal se esperan sin bloquear el event loop.
+    """
+
+    async def get(self, request, encrypted_email):
+        return await self._get(request, encrypted_email, PaymentServices())
+
+    async def post(self, request, encrypted_email):
+        return await self._post(request, encrypted_email, PaymentServices())
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncInitiateDLocalPaymentChangeView(InitiateDLocalPaymentChangeView):
+    """
+    Versión asíncrona de InitiateDLocalPaymentChangeView para despliegues ASGI.
+    """
+
+    async def post(self, request, encrypted_email):
+        return await self._post(request, encrypted_email, PaymentServices())
@@ -1,6 +1,18 @@
 import stripe
 from django.conf import settings
 from typing import Dict, List, Any, Optional
+from services.single_flight import SingleFlight
+from services.circuit_breaker import get_circuit_breaker, circuit_open_result, CircuitOpenError
+
+# Búsquedas idénticas de clientes en curso en el proceso comparten una sola llamada a Stripe
+_in_flight_customer_lookups = SingleFlight('stripe')
+
+# Errores de Stripe que indican que la API no está sana (cuentan como fallo en el circuito)
+_UPSTREAM_FAILURE_ERRORS = (
+    stripe.error.APIConnectionError,
+    stripe.error.APIError,
+    stripe.error.RateLimitError,
+)
 
 
 class StripeService:
@@ -12,6 +24,35 @@ class StripeService:
     def __init__(self):
         stripe.api_key = settings.STRIPE_SECRET_KEY
     
+    def _call_stripe(self, func):
+        """
+        Ejecuta una llamada a la API de Stripe a través del circuit breaker de Stripe.
+        
+        Raises:
+            CircuitOpenError: Si el circuito está abierto (la llamada no se intenta)
+            stripe.error.StripeError: Los errores de la llamada
+        """
+        breaker = get_circuit_breaker('stripe')
+        generation = breaker.allow_request()
+        if generation is None:
+            raise CircuitOpenError('stripe')
+        
+        try:
+            result = func()
+        except _UPSTREAM_FAILURE_ERRORS:
+            breaker.record_failure(generation)
+            raise
+        except stripe.error.StripeError:
+            # Tarjeta rechazada, parámetros inválidos...: la API respondió con normalidad
+            breaker.record_success(generation)
+            raise
+        except Exception:
+            breaker.record_failure(generation)
+            raise
+        
+        breaker.record_success(generation)
+        return result
+    
     def get_customer_by_email(self, email: str) -> Dict[str, Any]:
         """
         Busca un cliente por email.
@@ -23,8 +64,11 @@ class StripeService:
             Dict con los datos del cliente o error
         """
         try:
-            # Buscar cliente por email
-            customers = stripe.Customer.list(email=email, limit=1)
+            # Buscar cliente por email (el filtro de Stripe distingue mayúsculas: clave exacta)
+            customers = _in_flight_customer_lookups.do(
+                ('customer_by_email', email),
+                lambda: self._call_stripe(lambda: stripe.Customer.list(email=email, limit=1))
+            )
             
             if not customers.data:
                 return {
@@ -38,6 +82,8 @@ class StripeService:
                 'data': customers.data[0]
             }
             
+        except CircuitOpenError:
+            return circuit_open_result('stripe')
         except stripe.error.StripeError as e:
             # Personalizar mensajes de error según el tipo
             error_message = str(e)
@@ -68,11 +114,11 @@ class StripeService:
             Dict con los datos del Setup Intent o error
         """
         try:
-            intent = stripe.SetupIntent.create(
+            intent = self._call_stripe(lambda: stripe.SetupIntent.create(
                 customer=customer_id,
                 payment_method_types=['card'],
                 usage='off_session'
-            )
+            ))
             
             return {
                 'success': True,
@@ -83,6 +129,8 @@ class StripeService:
                 }
             }
             
+        except CircuitOpenError:
+            return circuit_open_result('stripe')
         except stripe.error.StripeError as e:
             # Personalizar mensajes de error según el tipo
             error_message = str(e)
@@ -113,13 +161,15 @@ class StripeService:
             Dict con los datos del Setup Intent o error
         """
         try:
-            intent = stripe.SetupIntent.retrieve(setup_intent_id)
+            intent = self._call_stripe(lambda: stripe.SetupIntent.retrieve(setup_intent_id))
             
             return {
                 'success': True,
                 'data': intent
             }
             
+        except CircuitOpenError:
+            return circuit_open_result('stripe')
         except stripe.error.StripeError as e:
             # Personalizar mensajes de error según el tipo
             error_message = str(e)
@@ -151,18 +201,20 @@ class StripeService:
             Dict con el resultado de la operación
         """
         try:
-            stripe.Customer.modify(
+            self._call_stripe(lambda: stripe.Customer.modify(
                 customer_id,
                 invoice_settings={
                     'default_payment_method': payment_method_id,
                 }
-            )
+            ))
             
             return {
                 'success': True,
                 'message': 'Método de pago establecido como predeterminado'
             }
             
+        except CircuitOpenError:
+            return circuit_open_result('stripe')
         except stripe.error.StripeError as e:
             # Personalizar mensajes de error según el tipo
             error_message = str(e)
@@ -1,12 +1,21 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 
 app_name = 'payment_method'
 
+# En despliegues ASGI las vistas que consultan WordPress, Stripe y dLocal pueden ser asíncronas
+if settings.PAYMENT_METHOD_ASYNC_VIEWS:
+    change_payment_method_view = async_views.AsyncChangePaymentMethodView
+    initiate_dlocal_view = async_views.AsyncInitiateDLocalPaymentChangeView
+else:
+    change_payment_method_view = views.ChangePaymentMethodView
+    initiate_dlocal_view = views.InitiateDLocalPaymentChangeView
+
 urlpatterns = [
-    path('<str:encrypted_email>/cambiar-metodo-pago/', views.ChangePaymentMethodView.as_view(), name='cambiar_metodo_pago'),
-    path('<str:encrypted_email>/iniciar-cambio-dlocal/', views.InitiateDLocalPaymentChangeView.as_view(), name='iniciar_cambio_dlocal'),
-    path('change/<str:encrypted_email>/', views.ChangePaymentMethodView.as_view(), name='change_payment_method_back'),
+    path('<str:encrypted_email>/cambiar-metodo-pago/', change_payment_method_view.as_view(), name='cambiar_metodo_pago'),
+    path('<str:encrypted_email>/iniciar-cambio-dlocal/', initiate_dlocal_view.as_view(), name='iniciar_cambio_dlocal'),
+    path('change/<str:encrypted_email>/', change_payment_method_view.as_view(), name='change_payment_method_back'),
     path('change/<str:encrypted_email>/success/', views.PaymentChangeSuccessView.as_view(), name='payment_change_success'),
     path('change/<str:encrypted_email>/error/', views.PaymentChangeErrorView.as_view(), name='payment_change_error'),
-]
\ No newline at end of file
+]
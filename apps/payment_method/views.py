@@ -6,14 +6,48 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import json
 import logging
+from asgiref.sync import async_to_sync
 from .services import StripeService
-from services.wordpress_service import WordPressService
+from services.wordpress_service import WordPressService, next_installment_after
+from services.async_wordpress_service import AsyncWordPressService
 from services.dlocal_service import DLocalService
+from services.service_adapters import ThreadServiceAdapter
 from apps.core.utils import decrypt_email
 
 logger = logging.getLogger(__name__)
 
 
+def is_circuit_open(result):
+    """
+    Indica si el resultado de un servicio externo es el fallo inmediato del circuit breaker.
+    """
+    return result.get('error_type') == 'CircuitOpen'
+
+
+def service_unavailable_json_response(result):
+    """
+    Respuesta JSON 503 cuando el circuito del servicio externo está abierto.
+    """
+    return JsonResponse({
+        'success': False,
+        'error': result['error']
+    }, status=503)
+
+
+class PaymentServices:
+    """
+    Servicios que usan los flujos de las vistas de cambio de método de pago. Sus
+    métodos son corrutinas que ejecutan la implementación síncrona en un hilo, así que
+    cada flujo se escribe una sola vez como corrutina: las vistas asíncronas la esperan
+    y las síncronas la ejecutan con async_to_sync.
+    """
+    
+    def __init__(self):
+        self.wordpress = AsyncWordPressService(WordPressService())
+        self.stripe = ThreadServiceAdapter(StripeService)
+        self.dlocal = ThreadServiceAdapter(DLocalService)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ChangePaymentMethodView(View):
     """
@@ -21,145 +55,201 @@ class ChangePaymentMethodView(View):
     """
     
     def get(self, request, encrypted_email):
+        return async_to_sync(self._get)(request, encrypted_email, PaymentServices())
+    
+    async def _get(self, request, encrypted_email, services):
+        """
+        Flujo de la página, común a la vista síncrona y a la asíncrona.
+        """
         try:
             customer_email = decrypt_email(encrypted_email)
         except Exception:
             logging.info('NO SE ENCONTRO LA ORDEN')
-            return render(request, 'payment_method/customer_not_found.html', {
-                'customer_email': 'Email inválido',
-                'error_details': 'El enlace proporcionado no es válido.'
-            }, status=400)
+            return self._invalid_link_response(request)
         
-        # Primero consultar WordPress para obtener órdenes estructuradas
-        wp_service = WordPressService()
-        structured_result = wp_service.get_customer_orders_structured(customer_email)
+        wp_service = services.wordpress
         
-        if not structured_result['success']:
-            return render(request, 'payment_method/error.html', {
-                'customer_email': customer_email,
-                'error_title': 'Error consultando información',
-                'error_message': 'No pudimos consultar tu información de órdenes. Por favor, verifica que el email sea correcto.',
-                'error_details': structured_result['error']
-            }, status=500)
+        # Ruta más rápida: perfil de pago local sincronizado desde WordPress (una fila)
+        payment_profile = await wp_service.get_customer_payment_profile(customer_email)
         
-        # Obtener información del método de pago usando la nueva API
-        payment_info = wp_service.get_customer_payment_methods(structured_result['structured_orders'])
+        # Ruta rápida: solo la última cuota wc-processing y su orden madre
+        payment_info = payment_profile or await wp_service.get_current_payment_method(customer_email)
         
-        # Si no tiene órdenes, mostrar error
-        if structured_result['summary']['total_installments'] == 0:
-            return render(request, 'payment_method/customer_not_found.html', {
-                'customer_email': customer_email,
-                'error_details': 'No se encontraron órdenes asociadas a este email.'
-            }, status=404)
+        if not payment_info['success']:
+            return self._orders_error_response(request, customer_email, payment_info['error'])
         
+        # La carga completa de órdenes solo se hace si la página la necesita (el perfil
+        # local ya trae los conteos y el monto de la siguiente cuota)
+        structured_result = None
+        if payment_profile:
+            structured_result = {'success': True, 'summary': payment_profile['summary'], 'structured_orders': []}
         
-
-        # Preparar información para mostrar el método de pago actual
-        latest_installment = payment_info.get('latest_processing_installment')
-        current_payment_info = {
-            'method': payment_info['payment_method'],
-            'display_name': self._get_payment_method_display_name(payment_info['payment_method']),
-            'latest_order_id': latest_installment['id'] if latest_installment else None,
-            'latest_order_date': latest_installment['date_created_gmt'] if latest_installment else None,
-            'has_stripe': structured_result['summary']['payment_methods']['stripe'],
-            'has_dlocal': structured_result['summary']['payment_methods']['dlocal'],
-            'orders_count': {
-                'total': structured_result['summary']['total_installments'],
-                'parent_orders': structured_result['summary']['parent_orders_count']
-            },
-            'payment_details': payment_info['payment_details']
-        }
+        async def load_structured():
+            nonlocal structured_result
+            if structured_result is None:
+                structured_result = await wp_service.get_customer_orders_structured(customer_email)
+            return structured_result
         
-        # Preparar contexto base
-        context = {
-            'customer_email': customer_email,
-            'encrypted_email': encrypted_email,
-            'current_payment_info': current_payment_info,
-            'primary_payment_method': payment_info['payment_method']
-        }
+        # Sin cuota wc-processing hay que cargar todo para saber si el cliente tiene órdenes
+        if not payment_info['latest_processing_installment']:
+            error_response = self._check_customer_orders(request, customer_email, await load_structured())
+            if error_response:
+                return error_response
+        
+        context = self._build_base_context(customer_email, encrypted_email, payment_info)
         
         # Solo proceder con Stripe si el usuario actualmente usa Stripe
         if payment_info['payment_method'] == 'stripe':
-            stripe_service = StripeService()
+            stripe_service = services.stripe
             
             # Buscar cliente en Stripe
-            customer_result = stripe_service.get_customer_by_email(customer_email)
+            customer_result = await stripe_service.get_customer_by_email(customer_email)
             if not customer_result['success']:
-                return render(request, 'payment_method/customer_not_found.html', {
-                    'customer_email': customer_email,
-                    'error_details': 'No se encontró una cuenta de Stripe asociada a este email.'
-                }, status=404)
+                if is_circuit_open(customer_result):
+                    return self._service_unavailable_response(request, customer_email, customer_result['error'])
+                return self._stripe_customer_not_found_response(request, customer_email)
             
             customer = customer_result['data']
             
             # Crear Setup Intent para Stripe
-            setup_intent_result = stripe_service.create_setup_intent(customer.id)
+            setup_intent_result = await stripe_service.create_setup_intent(customer.id)
             if not setup_intent_result['success']:
-                return render(request, 'payment_method/error.html', {
-                    'customer_email': customer_email,
-                    'error_title': 'Error de configuración de pago',
-                    'error_message': 'No pudimos preparar el sistema para configurar tu método de pago. Por favor, inténtalo de nuevo más tarde.',
-                    'error_details': setup_intent_result['error']
-                }, status=500)
+                if is_circuit_open(setup_intent_result):
+                    return self._service_unavailable_response(request, customer_email, setup_intent_result['error'])
+                return self._setup_intent_error_response(request, customer_email, setup_intent_result['error'])
             
-            # Agregar información de Stripe al contexto
-            context.update({
-                'customer': customer,
-                'setup_intent_client_secret': setup_intent_result['data']['client_secret'],
-                'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
-                'can_change_payment': True
-            })
+            context.update(self._build_stripe_context(customer, setup_intent_result))
         else:
             # Usuario usa dLocal o método no identificado como Stripe
-            dlocal_details = payment_info['payment_details']
-            context.update({
-                'can_change_payment': True,  # Puede cambiar con el nuevo flujo
-                'dlocal_info': f'Este usuario utiliza {payment_info["payment_method"]} como método de pago.',
-                'use_dlocal_flow': True  # Flag para indicar que use el flujo de dLocal
-            })
+            context.update(self._build_dlocal_context(payment_info))
             
             # Si tiene los metadatos de suscripción dLocal, obtener detalles
+            dlocal_details = payment_info['payment_details']
             if dlocal_details.get('current_plan_id') and dlocal_details.get('current_subscription_id'):
-                dlocal_service = DLocalService()
-                
-                plan_id = dlocal_details['current_plan_id']
-                subscription_id = dlocal_details['current_subscription_id']
+                details_result = await services.dlocal.get_subscription_details(
+                    dlocal_details['current_plan_id'], dlocal_details['current_subscription_id']
+                )
                 
-                details_result = dlocal_service.get_subscription_details(plan_id, subscription_id)
+                # Con dLocal caído no se podría completar el cambio: mejor avisar ya
+                if is_circuit_open(details_result):
+                    return self._service_unavailable_response(request, customer_email, details_result['error'])
                 
                 if details_result['success']:
                     subscription_data = details_result['data']
                     
                     # Obtener el monto correcto de la siguiente cuota
                     latest_processing_installment = payment_info.get('latest_processing_installment')
-                    
                     if latest_processing_installment:
-                        current_payment_number = latest_processing_installment.get('payment_number', 0)
-                        
-                        # Buscar la siguiente cuota en las órdenes estructuradas
-                        next_installment = None
-                        for order_group in structured_result['structured_orders']:
-                            for installment in order_group['installments']:
-                                installment_payment_number = installment.get('payment_number', 0)
-                                if installment_payment_number == current_payment_number + 1:
-                                    next_installment = installment
-                                    break
-                            if next_installment:
-                                break
-                        
-                        if next_installment:
-                            # Reemplazar el monto del next_payment con el de la siguiente cuota
-                            next_amount = float(next_installment['total_amount'])
-                            subscription_data['next_payment']['amount'] = next_amount
-                            subscription_data['plan']['amount'] = next_amount
+                        # Buscar la siguiente cuota en el perfil local o en las órdenes
+                        # estructuradas (dispara la carga completa)
+                        if payment_profile:
+                            next_installment = payment_profile['next_installment']
+                        else:
+                            next_installment = next_installment_after(await load_structured(), latest_processing_installment)
+                        self._apply_next_installment_amount(subscription_data, next_installment)
                     
                     context['dlocal_subscription_details'] = [subscription_data]
-                else:
-                    context['dlocal_subscription_details'] = []
-            else:
-                context['dlocal_subscription_details'] = []
+        
         return render(request, 'payment_method/change_payment_method.html', context)
     
+    def _invalid_link_response(self, request):
+        return render(request, 'payment_method/customer_not_found.html', {
+            'customer_email': 'Email inválido',
+            'error_details': 'El enlace proporcionado no es válido.'
+        }, status=400)
+    
+    def _orders_error_response(self, request, customer_email, error):
+        return render(request, 'payment_method/error.html', {
+            'customer_email': customer_email,
+            'error_title': 'Error consultando información',
+            'error_message': 'No pudimos consultar tu información de órdenes. Por favor, verifica que el email sea correcto.',
+            'error_details': error
+        }, status=500)
+    
+    def _service_unavailable_response(self, request, customer_email, error):
+        return render(request, 'payment_method/error.html', {
+            'customer_email': customer_email,
+            'error_title': 'Servicio de pagos no disponible',
+            'error_message': 'El servicio de pagos no está disponible en este momento. Por favor, inténtalo de nuevo en unos minutos.',
+            'error_details': error
+        }, status=503)
+    
+    def _stripe_customer_not_found_response(self, request, customer_email):
+        return render(request, 'payment_method/customer_not_found.html', {
+            'customer_email': customer_email,
+            'error_details': 'No se encontró una cuenta de Stripe asociada a este email.'
+        }, status=404)
+    
+    def _setup_intent_error_response(self, request, customer_email, error):
+        return render(request, 'payment_method/error.html', {
+            'customer_email': customer_email,
+            'error_title': 'Error de configuración de pago',
+            'error_message': 'No pudimos preparar el sistema para configurar tu método de pago. Por favor, inténtalo de nuevo más tarde.',
+            'error_details': error
+        }, status=500)
+    
+    def _check_customer_orders(self, request, customer_email, structured_result):
+        """
+        Respuesta de error si no se pudieron consultar las órdenes o el cliente no tiene
+        cuotas; None si se puede continuar.
+        """
+        if not structured_result['success']:
+            return self._orders_error_response(request, customer_email, structured_result['error'])
+        
+        # Si no tiene órdenes, mostrar error
+        if structured_result['summary']['total_installments'] == 0:
+            return render(request, 'payment_method/customer_not_found.html', {
+                'customer_email': customer_email,
+                'error_details': 'No se encontraron órdenes asociadas a este email.'
+            }, status=404)
+        return None
+    
+    def _build_base_context(self, customer_email, encrypted_email, payment_info):
+        """
+        Contexto común de la página. No incluye los conteos de órdenes: la plantilla no
+        los usa y obtenerlos exige cargar todas las órdenes del cliente.
+        """
+        latest_installment = payment_info.get('latest_processing_installment')
+        current_payment_info = {
+            'method': payment_info['payment_method'],
+            'display_name': self._get_payment_method_display_name(payment_info['payment_method']),
+            'latest_order_id': latest_installment['id'] if latest_installment else None,
+            'latest_order_date': latest_installment['date_created_gmt'] if latest_installment else None,
+            'payment_details': payment_info['payment_details']
+        }
+        
+        return {
+            'customer_email': customer_email,
+            'encrypted_email': encrypted_email,
+            'current_payment_info': current_payment_info,
+            'primary_payment_method': payment_info['payment_method']
+        }
+    
+    def _build_stripe_context(self, customer, setup_intent_result):
+        return {
+            'customer': customer,
+            'setup_intent_client_secret': setup_intent_result['data']['client_secret'],
+            'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
+            'can_change_payment': True
+        }
+    
+    def _build_dlocal_context(self, payment_info):
+        return {
+            'can_change_payment': True,  # Puede cambiar con el nuevo flujo
+            'dlocal_info': f'Este usuario utiliza {payment_info["payment_method"]} como método de pago.',
+            'use_dlocal_flow': True,  # Flag para indicar que use el flujo de dLocal
+            'dlocal_subscription_details': []
+        }
+    
+    def _apply_next_installment_amount(self, subscription_data, next_installment):
+        """
+        Reemplaza el monto del next_payment de dLocal con el de la siguiente cuota.
+        """
+        if next_installment:
+            next_amount = float(next_installment['total_amount'])
+            subscription_data['next_payment']['amount'] = next_amount
+            subscription_data['plan']['amount'] = next_amount
+    
     def _get_payment_method_display_name(self, payment_method):
         """
         Convierte el nombre del método de pago a un nombre más amigable.
@@ -176,6 +266,12 @@ class ChangePaymentMethodView(View):
         """
         Maneja la confirmación del setup del método de pago.
         """
+        return async_to_sync(self._post)(request, encrypted_email, PaymentServices())
+    
+    async def _post(self, request, encrypted_email, services):
+        """
+        Flujo de la confirmación, común a la vista síncrona y a la asíncrona.
+        """
         try:
             customer_email = decrypt_email(encrypted_email)
         except Exception:
@@ -194,10 +290,12 @@ class ChangePaymentMethodView(View):
                     'error': 'Información de pago incompleta. Por favor, intenta nuevamente.'
                 }, status=400)
             
-            stripe_service = StripeService()
-            intent_result = stripe_service.get_setup_intent(setup_intent_id)
+            stripe_service = services.stripe
+            intent_result = await stripe_service.get_setup_intent(setup_intent_id)
             
             if not intent_result['success']:
+                if is_circuit_open(intent_result):
+                    return service_unavailable_json_response(intent_result)
                 return JsonResponse({
                     'success': False,
                     'error': 'No pudimos verificar la información de pago. Por favor, intenta nuevamente.',
@@ -207,19 +305,18 @@ class ChangePaymentMethodView(View):
             intent = intent_result['data']
             
             if intent.status == 'succeeded' and intent.payment_method:
-                customer_result = stripe_service.get_customer_by_email(customer_email)
+                customer_result = await stripe_service.get_customer_by_email(customer_email)
                 if customer_result['success']:
                     customer_id = customer_result['data'].id
-                    default_result = stripe_service.set_default_payment_method(
+                    default_result = await stripe_service.set_default_payment_method(
                         customer_id, 
                         intent.payment_method
                     )
                     if not default_result['success']:
-                        print(f"Warning: No se pudo establecer como predeterminado: {default_result['error']}")
+                        logger.warning(f"No se pudo establecer como predeterminado: {default_result['error']}")
                 
                 # Actualizar _stripe_source_id para todas las cuotas que ya lo tengan
-                wp_service = WordPressService()
-                update_result = wp_service.update_stripe_source_id_for_customer(
+                update_result = await services.wordpress.update_stripe_source_id_for_customer(
                     email=customer_email,
                     new_payment_method_id=intent.payment_method
                 )
@@ -228,9 +325,9 @@ class ChangePaymentMethodView(View):
                 if update_result['success']:
                     updated_count = update_result['summary']['updated_count']
                     skipped_count = update_result['summary']['skipped_count']
-                    print(f"WordPress: Actualizadas {updated_count} cuotas, omitidas {skipped_count}")
+                    logger.info(f"WordPress: Actualizadas {updated_count} cuotas, omitidas {skipped_count}")
                 else:
-                    print(f"Warning WordPress: {update_result['error']}")
+                    logger.warning(f"WordPress: {update_result['error']}")
             
             return JsonResponse({
                 'success': True,
@@ -261,6 +358,12 @@ class InitiateDLocalPaymentChangeView(View):
         """
         Inicia el proceso de cambio de método de pago para dLocal.
         """
+        return async_to_sync(self._post)(request, encrypted_email, PaymentServices())
+    
+    async def _post(self, request, encrypted_email, services):
+        """
+        Flujo del inicio del cambio, común a la vista síncrona y a la asíncrona.
+        """
         try:
             customer_email = decrypt_email(encrypted_email)
         except Exception:
@@ -281,10 +384,12 @@ class InitiateDLocalPaymentChangeView(View):
                 }, status=400)
             
             # Obtener detalles de la suscripción actual
-            dlocal_service = DLocalService()
-            subscription_details = dlocal_service.get_subscription_details(plan_id, subscription_id)
+            dlocal_service = services.dlocal
+            subscription_details = await dlocal_service.get_subscription_details(plan_id, subscription_id)
             
             if not subscription_details['success']:
+                if is_circuit_open(subscription_details):
+                    return service_unavailable_json_response(subscription_details)
                 return JsonResponse({
                     'success': False,
                     'error': 'No se pudo obtener información de la suscripción actual.',
@@ -295,133 +400,56 @@ class InitiateDLocalPaymentChangeView(View):
             plan = subscription_data['plan']
             next_payment = subscription_data.get('next_payment', {})
             
-            # Obtener órdenes estructuradas para encontrar la última cuota wc-processing
-            wp_service = WordPressService()
-            structured_result = wp_service.get_customer_orders_structured(customer_email)
+            # Ruta rápida para encontrar la última cuota wc-processing
+            wp_service = services.wordpress
+            payment_info = await wp_service.get_current_payment_method(customer_email)
             
-            if structured_result['success']:
-                payment_info = wp_service.get_customer_payment_methods(structured_result['structured_orders'])
-                latest_processing_installment = payment_info.get('latest_processing_installment')
-                
-                if latest_processing_installment:
-                    # Buscar la próxima cuota después de la última wc-processing
-                    current_payment_number = latest_processing_installment.get('payment_number', 0)
-                    
-                    # Buscar la siguiente cuota en todas las órdenes estructuradas
-                    next_installment = None
-                    for order_group in structured_result['structured_orders']:
-                        for installment in order_group['installments']:
-                            installment_payment_number = installment.get('payment_number', 0)
-                            if installment_payment_number == current_payment_number + 1:
-                                next_installment = installment
-                                break
-                        if next_installment:
-                            break
-                    
-                    if next_installment:
-                        # Usar el monto de la siguiente cuota en lugar del next_payment de dLocal
-                        next_payment_amount = float(next_installment['total_amount'])
-                    else:
-                        # Si no hay siguiente cuota, usar el monto del next_payment de dLocal
-                        next_payment_amount = next_payment['amount']
-                else:
-                    # Si no hay cuota wc-processing, usar el monto del next_payment de dLocal
-                    next_payment_amount = next_payment['amount']
-            else:
-                # Si hay error obteniendo órdenes, usar el monto del next_payment de dLocal
-                next_payment_amount = next_payment['amount']
+            next_installment = None
+            if payment_info['success'] and payment_info.get('latest_processing_installment'):
+                # Buscar la siguiente cuota del mismo plan en el índice de las órdenes estructuradas
+                structured_result = await wp_service.get_customer_orders_structured(customer_email)
+                next_installment = next_installment_after(structured_result, payment_info['latest_processing_installment'])
+            next_payment_amount = self._get_next_payment_amount(next_installment, next_payment)
             
             if not next_payment.get('can_estimate'):
-                return JsonResponse({
-                    'success': False,
-                    'error': 'No se puede determinar la próxima fecha de pago. Contacta soporte para asistencia.'
-                }, status=400)
-            
-            # Crear un nuevo plan con la misma configuración
-            new_plan_data = {
-                'name': f"{plan['name']} - Cambio de Método de Pago",
-                'description': f"Cambio de método de pago",
-                'country': plan.get('country'),
-                'currency': plan['currency'],
-                'amount': next_payment_amount,
-                'frequency_type': plan['frequency_type'],
-                'frequency_value': plan.get('frequency_value', 1),
-                'success_url': f"{request.build_absolute_uri('/').rstrip('/')}/metodo-pago/change/{encrypted_email}/success/",
-                'back_url': f"{request.build_absolute_uri('/').rstrip('/')}/metodo-pago/change/{encrypted_email}/",
-                'error_url': f"{request.build_absolute_uri('/').rstrip('/')}/metodo-pago/change/{encrypted_email}/error/",
-                'notification_url': settings.CONQUERPASS_DLOCAL_WEBHOOK
-            }
-            
-            logger.info(f"[DLOCAL PAYMENT CHANGE] Creating new plan with amount: {next_payment_amount}")
+                return self._cannot_estimate_response()
             
-            # Remover campos opcionales si están vacíos
-            if not new_plan_data['country']:
-                del new_plan_data['country']
+            new_plan_data = self._build_new_plan_data(request, encrypted_email, plan, next_payment_amount)
             
             logger.info(f"[DLOCAL PAYMENT CHANGE] Sending plan data to dLocal: {new_plan_data}")
             
-            create_plan_result = dlocal_service.create_plan(new_plan_data)
+            create_plan_result = await dlocal_service.create_plan(new_plan_data, plan_id, subscription_id)
             
-            logger.info(f"[DLOCAL PAYMENT CHANGE] dLocal create_plan response: {create_plan_result}")
-            
-            if not create_plan_result['success']:
-                logger.error(f"[DLOCAL PAYMENT CHANGE] Failed to create plan: {create_plan_result.get('error', 'Unknown error')}")
-                return JsonResponse({
-                    'success': False,
-                    'error': 'No se pudo crear el plan para el cambio de método de pago.',
-                    'details': create_plan_result.get('error', 'Error desconocido')
-                }, status=500)
+            error_response = self._check_create_plan_result(create_plan_result)
+            if error_response:
+                return error_response
             
             new_plan = create_plan_result['data']
-            checkout_url = new_plan.get('subscribe_url')
             
-            if not checkout_url:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'No se pudo generar la URL de pago.'
-                }, status=500)
-            
-            # Guardar la ID del nuevo plan como metadato en la orden padre
-            structured_result = wp_service.get_customer_orders_structured(customer_email)
-            
-            if structured_result['success']:
-                payment_info = wp_service.get_customer_payment_methods(structured_result['structured_orders'])
-                parent_order_id = payment_info.get('latest_processing_parent_order_id')
+            # Guardar la ID del nuevo plan como metadato en la orden padre (la orden
+            # se elige con una lectura en la primaria, no con la caché ni la réplica)
+            payment_info = await wp_service.get_current_payment_method(customer_email, for_update=True)
+            parent_order_id = self._get_parent_order_id_for_new_plan(payment_info)
+            
+            if parent_order_id:
+                # Guardar la ID del nuevo plan temporalmente en la orden padre
+                update_result = await wp_service.update_order_meta(
+                    order_id=parent_order_id,
+                    meta_key='_dlocal_temp_new_plan_id',
+                    meta_value=str(new_plan['id']),
+                    email=customer_email
+                )
                 
-                if parent_order_id:
-                    # Guardar la ID del nuevo plan temporalmente en la orden padre
-                    update_result = wp_service.update_order_meta(
-                        order_id=parent_order_id,
-                        meta_key='_dlocal_temp_new_plan_id',
-                        meta_value=str(new_plan['id'])
-                    )
-                    
-                    # Log del resultado pero no fallar si hay error en WordPress
-                    if update_result['success']:
-                        logger.info(f"Guardada nueva plan ID {new_plan['id']} para orden padre {parent_order_id}")
-                    else:
-                        logger.warning(f"Error guardando nueva plan ID en WordPress: {update_result['error']}")
+                # Log del resultado pero no fallar si hay error en WordPress
+                if update_result['success']:
+                    logger.info(f"Guardada nueva plan ID {new_plan['id']} para orden padre {parent_order_id}")
                 else:
-                    logger.warning("No se encontró orden padre para guardar la nueva plan ID")
-            else:
-                logger.warning(f"Error obteniendo órdenes para guardar nueva plan ID: {structured_result['error']}")
+                    logger.warning(f"Error guardando nueva plan ID en WordPress: {update_result['error']}")
             
             # Guardar información del proceso en la sesión o base de datos si es necesario
             # Por simplicidad, se incluye en la respuesta
             
-            return JsonResponse({
-                'success': True,
-                'checkout_url': checkout_url,
-                'new_plan_id': new_plan['id'],
-                'new_plan_token': new_plan['plan_token'],
-                'original_plan_id': plan_id,
-                'original_subscription_id': subscription_id,
-                'next_payment_info': {
-                    'amount': next_payment_amount,
-                    'currency': next_payment['currency'],
-                    'estimated_date': next_payment.get('estimated_date')
-                }
-            })
+            return self._success_response(new_plan, plan_id, subscription_id, next_payment_amount, next_payment)
             
         except json.JSONDecodeError:
             return JsonResponse({
@@ -435,6 +463,100 @@ class InitiateDLocalPaymentChangeView(View):
                 'error': 'Ha ocurrido un error inesperado. Por favor, intenta nuevamente.'
             }, status=500)
 
+    def _get_next_payment_amount(self, next_installment, next_payment):
+        """
+        Monto del próximo pago: el de la siguiente cuota después de la última wc-processing
+        o, si no la hay (o no se pudieron consultar las órdenes), el next_payment de dLocal.
+        """
+        if next_installment:
+            return float(next_installment['total_amount'])
+        return next_payment['amount']
+    
+    def _cannot_estimate_response(self):
+        return JsonResponse({
+            'success': False,
+            'error': 'No se puede determinar la próxima fecha de pago. Contacta soporte para asistencia.'
+        }, status=400)
+    
+    def _build_new_plan_data(self, request, encrypted_email, plan, next_payment_amount):
+        """
+        Datos del nuevo plan con la misma configuración que el actual.
+        """
+        base_url = request.build_absolute_uri('/').rstrip('/')
+        new_plan_data = {
+            'name': f"{plan['name']} - Cambio de Método de Pago",
+            'description': f"Cambio de método de pago",
+            'country': plan.get('country'),
+            'currency': plan['currency'],
+            'amount': next_payment_amount,
+            'frequency_type': plan['frequency_type'],
+            'frequency_value': plan.get('frequency_value', 1),
+            'success_url': f"{base_url}/metodo-pago/change/{encrypted_email}/success/",
+            'back_url': f"{base_url}/metodo-pago/change/{encrypted_email}/",
+            'error_url': f"{base_url}/metodo-pago/change/{encrypted_email}/error/",
+            'notification_url': settings.CONQUERPASS_DLOCAL_WEBHOOK
+        }
+        
+        logger.info(f"[DLOCAL PAYMENT CHANGE] Creating new plan with amount: {next_payment_amount}")
+        
+        # Remover campos opcionales si están vacíos
+        if not new_plan_data['country']:
+            del new_plan_data['country']
+        
+        return new_plan_data
+    
+    def _check_create_plan_result(self, create_plan_result):
+        """
+        Respuesta de error si no se pudo crear el plan o no trae URL de pago; None si
+        se puede continuar.
+        """
+        logger.info(f"[DLOCAL PAYMENT CHANGE] dLocal create_plan response: {create_plan_result}")
+        
+        if not create_plan_result['success']:
+            logger.error(f"[DLOCAL PAYMENT CHANGE] Failed to create plan: {create_plan_result.get('error', 'Unknown error')}")
+            if is_circuit_open(create_plan_result):
+                return service_unavailable_json_response(create_plan_result)
+            return JsonResponse({
+                'success': False,
+                'error': 'No se pudo crear el plan para el cambio de método de pago.',
+                'details': create_plan_result.get('error', 'Error desconocido')
+            }, status=500)
+        
+        if not create_plan_result['data'].get('subscribe_url'):
+            return JsonResponse({
+                'success': False,
+                'error': 'No se pudo generar la URL de pago.'
+            }, status=500)
+        return None
+    
+    def _get_parent_order_id_for_new_plan(self, payment_info):
+        """
+        Orden madre de la última cuota wc-processing, donde se guarda la ID del nuevo plan.
+        """
+        if not payment_info['success']:
+            logger.warning(f"Error obteniendo órdenes para guardar nueva plan ID: {payment_info['error']}")
+            return None
+        
+        parent_order_id = payment_info.get('latest_processing_parent_order_id')
+        if not parent_order_id:
+            logger.warning("No se encontró orden padre para guardar la nueva plan ID")
+        return parent_order_id
+    
+    def _success_response(self, new_plan, plan_id, subscription_id, next_payment_amount, next_payment):
+        return JsonResponse({
+            'success': True,
+            'checkout_url': new_plan['subscribe_url'],
+            'new_plan_id': new_plan['id'],
+            'new_plan_token': new_plan['plan_token'],
+            'original_plan_id': plan_id,
+            'original_subscription_id': subscription_id,
+            'next_payment_info': {
+                'amount': next_payment_amount,
+                'currency': next_payment['currency'],
+                'estimated_date': next_payment.get('estimated_date')
+            }
+        })
+
 
 class PaymentChangeSuccessView(View):
     def get(self, request, encrypted_email):
@@ -62,6 +62,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.WordPressQueryStatsMiddleware',
+    'core.middleware.WordPressDeadlineMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -120,6 +122,27 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# locmem por defecto; en producción con varios workers conviene un backend compartido
+# (p. ej. django.core.cache.backends.redis.RedisCache) para que las invalidaciones lleguen a todos
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='conquerpass'),
+    },
+    # Respuestas de la API de dLocal (ver DLOCAL_CACHE_TTL)
+    'dlocal': {
+        'BACKEND': config('DLOCAL_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('DLOCAL_CACHE_LOCATION', default='conquerpass-dlocal'),
+    },
+}
+# Con locmem, la caché de dLocal se acota por cantidad de entradas (descarta las menos usadas)
+if CACHES['dlocal']['BACKEND'].endswith('LocMemCache'):
+    CACHES['dlocal']['OPTIONS'] = {'MAX_ENTRIES': config('DLOCAL_CACHE_MAX_ENTRIES', default=1000, cast=int)}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -153,6 +176,52 @@ WORDPRESS_DB_PASSWORD = config('WORDPRESS_DB_PASSWORD', default='')
 WORDPRESS_DB_NAME = config('WORDPRESS_DB_NAME', default='')
 WORDPRESS_DB_PORT = config('WORDPRESS_DB_PORT', default='', cast=lambda x: int(x) if x else None)
 
+# Réplica de lectura opcional de WordPress (vacío = todas las lecturas van a la primaria).
+# Usuario, password, base y puerto vacíos heredan los de la primaria.
+WORDPRESS_DB_REPLICA_HOST = config('WORDPRESS_DB_REPLICA_HOST', default='')
+WORDPRESS_DB_REPLICA_USER = config('WORDPRESS_DB_REPLICA_USER', default='')
+WORDPRESS_DB_REPLICA_PASSWORD = config('WORDPRESS_DB_REPLICA_PASSWORD', default='')
+WORDPRESS_DB_REPLICA_NAME = config('WORDPRESS_DB_REPLICA_NAME', default='')
+WORDPRESS_DB_REPLICA_PORT = config('WORDPRESS_DB_REPLICA_PORT', default='', cast=lambda x: int(x) if x else None)
+# Segundos durante los que las lecturas de un email recién escrito van a la primaria
+WORDPRESS_DB_READ_YOUR_WRITES_SECONDS = config('WORDPRESS_DB_READ_YOUR_WRITES_SECONDS', default=5, cast=int)
+
+# Pool de conexiones a WordPress (compartido por proceso)
+WORDPRESS_DB_POOL_MIN_SIZE = config('WORDPRESS_DB_POOL_MIN_SIZE', default=0, cast=int)
+WORDPRESS_DB_POOL_MAX_SIZE = config('WORDPRESS_DB_POOL_MAX_SIZE', default=10, cast=int)
+WORDPRESS_DB_POOL_MAX_AGE = config('WORDPRESS_DB_POOL_MAX_AGE', default=3600, cast=int)  # segundos
+WORDPRESS_DB_POOL_TIMEOUT = config('WORDPRESS_DB_POOL_TIMEOUT', default=10, cast=float)  # segundos de espera por conexión libre
+
+# Timeouts de las conexiones a WordPress (segundos). Dentro de un request el read timeout se
+# acota a lo que queda de WORDPRESS_REQUEST_DEADLINE
+WORDPRESS_DB_CONNECT_TIMEOUT = config('WORDPRESS_DB_CONNECT_TIMEOUT', default=5, cast=int)
+WORDPRESS_DB_READ_TIMEOUT = config('WORDPRESS_DB_READ_TIMEOUT', default=30, cast=int)
+WORDPRESS_DB_WRITE_TIMEOUT = config('WORDPRESS_DB_WRITE_TIMEOUT', default=30, cast=int)
+
+# Presupuesto de tiempo por request para consultas a WordPress (0 lo desactiva). Agotado,
+# las consultas fallan con DeadlineExceeded y los snapshots se sirven desde la caché
+WORDPRESS_REQUEST_DEADLINE = config('WORDPRESS_REQUEST_DEADLINE', default=20, cast=float)  # segundos
+
+# Umbral a partir del cual una consulta a WordPress se registra en el log de consultas lentas
+WORDPRESS_SLOW_QUERY_MS = config('WORDPRESS_SLOW_QUERY_MS', default=200, cast=int)
+
+# Caché de snapshots de clientes entre requests (0 la desactiva)
+WORDPRESS_SNAPSHOT_CACHE_ALIAS = config('WORDPRESS_SNAPSHOT_CACHE_ALIAS', default='default')
+WORDPRESS_SNAPSHOT_CACHE_TTL = config('WORDPRESS_SNAPSHOT_CACHE_TTL', default=60, cast=int)  # segundos
+# Última versión buena de cada snapshot, servida solo si se agota el presupuesto del request
+WORDPRESS_STALE_SNAPSHOT_TTL = config('WORDPRESS_STALE_SNAPSHOT_TTL', default=3600, cast=int)  # segundos
+
+# Antigüedad máxima de la última sincronización de la tabla local de cuotas para usarla
+# en lugar de los metadatos de WordPress (0 la desactiva)
+WORDPRESS_INSTALLMENT_LINKS_MAX_STALENESS = config('WORDPRESS_INSTALLMENT_LINKS_MAX_STALENESS', default=600, cast=int)  # segundos
+
+# Antigüedad máxima de la última sincronización de los perfiles de pago locales para
+# mostrar la página de cambio de método de pago desde ellos (0 la desactiva)
+WORDPRESS_PAYMENT_PROFILE_MAX_STALENESS = config('WORDPRESS_PAYMENT_PROFILE_MAX_STALENESS', default=600, cast=int)  # segundos
+
+# Vistas asíncronas de cambio de método de pago (para despliegues ASGI, config/asgi.py)
+PAYMENT_METHOD_ASYNC_VIEWS = config('PAYMENT_METHOD_ASYNC_VIEWS', default=False, cast=bool)
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
@@ -179,6 +248,12 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
         },
+        'slow_query_file': {
+            'level': 'WARNING',
+            'class': 'logging.FileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'slow_queries.log'),
+            'formatter': 'verbose',
+        },
     },
     'root': {
         'handlers': ['file', 'console'],
@@ -195,6 +270,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'conquerpass.slow_query': {
+            'handlers': ['slow_query_file', 'console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
 
@@ -203,3 +283,30 @@ DLOCAL_API_KEY = config('DLOCAL_API_KEY', default='')
 DLOCAL_SECRET_KEY = config('DLOCAL_SECRET_KEY', default='')
 DLOCAL_BASE_URL = config('DLOCAL_BASE_URL', default='https://api-sbx.dlocalgo.com')
 CONQUERPASS_DLOCAL_WEBHOOK = config('CONQUERPASS_DLOCAL_WEBHOOK', default='')
+# Conexiones HTTP a dLocal: timeouts (segundos) y conexiones keep-alive por proceso
+DLOCAL_CONNECT_TIMEOUT = config('DLOCAL_CONNECT_TIMEOUT', default=3.05, cast=float)
+DLOCAL_READ_TIMEOUT = config('DLOCAL_READ_TIMEOUT', default=15, cast=float)
+DLOCAL_HTTP_POOL_SIZE = config('DLOCAL_HTTP_POOL_SIZE', default=10, cast=int)
+# Paginación de ejecuciones de suscripciones: tamaño de página y páginas pedidas en paralelo
+DLOCAL_EXECUTIONS_PAGE_SIZE = config('DLOCAL_EXECUTIONS_PAGE_SIZE', default=50, cast=int)
+DLOCAL_PAGINATION_WORKERS = config('DLOCAL_PAGINATION_WORKERS', default=4, cast=int)
+# Caché de detalles y ejecuciones de suscripciones (0 la desactiva)
+DLOCAL_CACHE_ALIAS = config('DLOCAL_CACHE_ALIAS', default='dlocal')
+DLOCAL_CACHE_TTL = config('DLOCAL_CACHE_TTL', default=30, cast=int)  # segundos
+
+# Circuit breakers de servicios externos (services/circuit_breaker.py). Cada circuito se abre
+# si en sus últimas window_size llamadas (con al menos minimum_calls) la proporción de fallos
+# llega a failure_rate_threshold; abierto, las llamadas fallan de inmediato durante
+# open_seconds y luego se prueban half_open_max_calls llamadas antes de cerrarlo
+CIRCUIT_BREAKER_SETTINGS = {
+    'default': {
+        'failure_rate_threshold': config('CIRCUIT_BREAKER_FAILURE_RATE', default=0.5, cast=float),
+        'minimum_calls': config('CIRCUIT_BREAKER_MINIMUM_CALLS', default=10, cast=int),
+        'window_size': config('CIRCUIT_BREAKER_WINDOW_SIZE', default=20, cast=int),
+        'open_seconds': config('CIRCUIT_BREAKER_OPEN_SECONDS', default=30, cast=float),
+        'half_open_max_calls': config('CIRCUIT_BREAKER_HALF_OPEN_CALLS', default=1, cast=int),
+    },
+    # Sobrescrituras por servicio, p. ej. 'dlocal': {'open_seconds': 60}
+    'dlocal': {},
+    'stripe': {},
+}
@@ -25,4 +25,5 @@ urlpatterns = [
     path('', home_redirect, name='home'),
     path('admin/', admin.site.urls),
     path('metodo-pago/', include('payment_method.urls')),
+    path('estado/', include('core.urls')),
 ]
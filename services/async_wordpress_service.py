@@ -0,0 +1,96 @@
+import asyncio
+import weakref
+import logging
+from typing import Dict, List, Any, Optional, Iterable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from services.wordpress_service import WordPressService, PAYMENT_META_KEYS
+
+logger = logging.getLogger(__name__)
+
+# Un semáforo por event loop: asyncio.Semaphore queda ligado al loop en el que se usa
+_semaphores: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = weakref.WeakKeyDictionary()
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """
+    Semáforo de admisión al pool de WordPress DB del event loop actual, dimensionado
+    con WORDPRESS_DB_POOL_MAX_SIZE: las corrutinas esperan turno en el loop en lugar
+    de ocupar un hilo bloqueado esperando una conexión libre.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, getattr(settings, 'WORDPRESS_DB_POOL_MAX_SIZE', 10)))
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+class AsyncWordPressService:
+    """
+    Contraparte asíncrona de WordPressService para despliegues ASGI.
+
+    Expone los mismos métodos públicos como corrutinas. Cada llamada ejecuta la
+    implementación de WordPressService (mismas consultas, pool, caché e
+    instrumentación) en un hilo mediante sync_to_async, de modo que el event loop
+    queda libre mientras MySQL responde. La concurrencia hacia la base de datos se
+    limita con un semáforo del tamaño del pool.
+    """
+
+    def __init__(self, wp_service: Optional[WordPressService] = None):
+        """
+        Args:
+            wp_service: Instancia síncrona a envolver (por defecto una nueva). Se comparte
+                entre llamadas, así que la memoización por instancia sigue valiendo.
+        """
+        self.sync_service = wp_service or WordPressService()
+
+    async def _run(self, method, *args, **kwargs):
+        async with _get_semaphore():
+            return await sync_to_async(method)(*args, **kwargs)
+
+    async def test_connection(self) -> Dict[str, Any]:
+        return await self._run(self.sync_service.test_connection)
+
+    async def update_order_meta(self, order_id: int, meta_key: str, meta_value: str,
+                                email: Optional[str] = None) -> Dict[str, Any]:
+        return await self._run(self.sync_service.update_order_meta, order_id, meta_key, meta_value, email=email)
+
+    async def bulk_update_order_meta(self, order_ids: List[int], meta_key: str, meta_value: str,
+                                     email: Optional[str] = None) -> Dict[str, Any]:
+        return await self._run(self.sync_service.bulk_update_order_meta, order_ids, meta_key, meta_value, email=email)
+
+    async def get_customer_orders_structured(self, email: str,
+                                             meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS) -> Dict[str, Any]:
+        return await self._run(self.sync_service.get_customer_orders_structured, email, meta_keys)
+
+    async def get_customers_orders_structured(self, emails: Iterable[str],
+                                              meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS) -> Dict[str, Dict[str, Any]]:
+        return await self._run(self.sync_service.get_customers_orders_structured, list(emails), meta_keys)
+
+    async def get_customer_payment_methods(self, structured_orders: List[Dict]) -> Dict[str, Any]:
+        # Sin I/O: no hace falta salir del event loop
+        return self.sync_service.get_customer_payment_methods(structured_orders)
+
+    async def get_current_payment_method(self, email: str,
+                                         meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS,
+                                         for_update: bool = False) -> Dict[str, Any]:
+        return await self._run(self.sync_service.get_current_payment_method, email, meta_keys, for_update=for_update)
+
+    async def get_customer_payment_profile(self, email: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self.sync_service.get_customer_payment_profile, email)
+
+    async def get_customer_orders_summary(self, email: str,
+                                          meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS) -> Dict[str, Any]:
+        return await self._run(self.sync_service.get_customer_orders_summary, email, meta_keys)
+
+    async def update_stripe_source_id_for_customer(self, email: str, new_payment_method_id: str) -> Dict[str, Any]:
+        return await self._run(self.sync_service.update_stripe_source_id_for_customer, email, new_payment_method_id)
+
+    async def sync_installment_links(self, batch_size: int = 1000, full: bool = False) -> Dict[str, Any]:
+        return await self._run(self.sync_service.sync_installment_links, batch_size, full)
+
+    async def sync_customer_payment_profiles(self, batch_size: int = 500, full: bool = False) -> Dict[str, Any]:
+        return await self._run(self.sync_service.sync_customer_payment_profiles, batch_size, full)
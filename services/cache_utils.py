@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import uuid
+from typing import Any, Optional
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def hash_key(value: str) -> str:
+    """
+    Hash estable para usar datos de clientes (p. ej. emails) en claves de caché
+    sin guardarlos en claro.
+    """
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+class VersionedCache:
+    """
+    Caché con TTL sobre el framework de caché de Django, organizada en grupos.
+
+    Cada grupo (p. ej. el hash de un email) tiene una versión propia guardada en la
+    caché; las claves de sus entradas incluyen esa versión. Invalidar un grupo borra
+    su versión, de modo que todas sus entradas quedan inaccesibles de una vez sin
+    tener que enumerarlas. Los fallos del backend se registran y se tratan como
+    un fallo de caché: nunca interrumpen la operación principal.
+    """
+
+    def __init__(self, prefix: str, alias: str = 'default', timeout: int = 60):
+        self.prefix = prefix
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.timeout and self.timeout > 0)
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def _version_key(self, group: str) -> str:
+        return f"{self.prefix}:version:{group}"
+
+    def _group_version(self, group: str, create: bool) -> Optional[str]:
+        version = self._cache.get(self._version_key(group))
+        if version is None and create:
+            version = uuid.uuid4().hex[:12]
+            # add() no pisa la versión que otro proceso haya creado entretanto
+            if not self._cache.add(self._version_key(group), version, None):
+                version = self._cache.get(self._version_key(group), version)
+        return version
+
+    def _entry_key(self, group: str, version: str, key: str) -> str:
+        return f"{self.prefix}:{group}:{version}:{key}"
+
+    def get(self, group: str, key: str, default: Any = None) -> Any:
+        """
+        Obtiene una entrada del grupo, o default si no existe o el grupo fue invalidado.
+        """
+        if not self.enabled:
+            return default
+        try:
+            version = self._group_version(group, create=False)
+            if version is None:
+                return default
+            return self._cache.get(self._entry_key(group, version, key), default)
+        except Exception as e:
+            logger.warning(f"Error leyendo caché {self.prefix}: {str(e)}")
+            return default
+
+    def version(self, group: str) -> Optional[str]:
+        """
+        Versión actual del grupo (la crea si no existe). Quien lee de la base de datos
+        debe tomarla antes de la lectura y pasarla a set(): si el grupo se invalida
+        mientras tanto, el valor se guarda bajo la versión vieja y nadie lo leerá.
+        """
+        if not self.enabled:
+            return None
+        try:
+            return self._group_version(group, create=True)
+        except Exception as e:
+            logger.warning(f"Error leyendo caché {self.prefix}: {str(e)}")
+            return None
+
+    def set(self, group: str, key: str, value: Any, timeout: Optional[int] = None,
+            version: Optional[str] = None):
+        """
+        Guarda una entrada en el grupo con el TTL indicado (o el del constructor).
+        """
+        if not self.enabled:
+            return
+        try:
+            if version is None:
+                version = self._group_version(group, create=True)
+            self._cache.set(self._entry_key(group, version, key), value,
+                            self.timeout if timeout is None else timeout)
+        except Exception as e:
+            logger.warning(f"Error escribiendo caché {self.prefix}: {str(e)}")
+
+    def invalidate(self, group: str):
+        """
+        Invalida todas las entradas del grupo.
+        """
+        try:
+            self._cache.delete(self._version_key(group))
+        except Exception as e:
+            logger.warning(f"Error invalidando caché {self.prefix}: {str(e)}")
@@ -0,0 +1,197 @@
+import time
+import threading
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    El circuito del servicio externo está abierto: la llamada no se intentó.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuito '{name}' abierto")
+        self.name = name
+
+
+def circuit_open_result(name: str) -> Dict[str, Any]:
+    """
+    Resultado de error estándar de los servicios cuando el circuito está abierto.
+    """
+    return {
+        'success': False,
+        'error': 'El servicio de pagos no está disponible en este momento. Por favor, intenta nuevamente en unos minutos.',
+        'error_type': 'CircuitOpen',
+        'upstream': name
+    }
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por servicio externo, seguro entre hilos.
+
+    - Cerrado: las llamadas pasan y su resultado se guarda en una ventana con las
+      últimas window_size llamadas. Si en la ventana hay al menos minimum_calls y la
+      proporción de fallos llega a failure_rate_threshold, el circuito se abre.
+    - Abierto: las llamadas fallan de inmediato (sin esperar a la red) durante
+      open_seconds.
+    - Semiabierto: pasado ese tiempo se permiten hasta half_open_max_calls llamadas
+      de prueba; si todas salen bien el circuito se cierra, y con un fallo vuelve a abrirse.
+
+    Las llamadas permitidas por allow_request() deben informar su resultado con
+    record_success() o record_failure(), pasando la generación que les devolvió
+    allow_request(). Cada cambio de estado abre una generación nueva y los resultados
+    de generaciones anteriores se descartan: una llamada admitida con el circuito
+    cerrado que termina ya en semiabierto no cuenta como llamada de prueba.
+    """
+
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, minimum_calls: int = 10,
+                 window_size: int = 20, open_seconds: float = 30, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = max(1, minimum_calls)
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._generation = 1
+        self._outcomes = deque(maxlen=max(self.minimum_calls, window_size))  # True = fallo
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._half_open_successes = 0
+        self._rejected_calls = 0
+
+    def _transition(self, state: str):
+        if state == self._state:
+            return
+        logger.warning(f"[CIRCUIT BREAKER] {self.name}: {self._state} -> {state}")
+        self._state = state
+        self._generation += 1
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == HALF_OPEN:
+            self._half_open_calls = 0
+            self._half_open_successes = 0
+        elif state == CLOSED:
+            self._outcomes.clear()
+
+    def _current_state(self) -> str:
+        # Abierto pasa a semiabierto al vencer open_seconds (se evalúa al consultar)
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self) -> Optional[int]:
+        """
+        Indica si la llamada puede intentarse. En semiabierto reserva una de las
+        llamadas de prueba.
+
+        Returns:
+            La generación en la que se admitió la llamada (para record_success() y
+            record_failure()), o None si el circuito la rechaza
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return self._generation
+            if state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return self._generation
+            self._rejected_calls += 1
+            return None
+
+    def record_success(self, generation: int):
+        with self._lock:
+            state = self._current_state()
+            if generation != self._generation:
+                # Admitida antes del último cambio de estado: ya no dice nada del actual
+                return
+            if state == HALF_OPEN:
+                self._half_open_successes += 1
+                if self._half_open_successes >= self.half_open_max_calls:
+                    self._transition(CLOSED)
+            elif state == CLOSED:
+                self._outcomes.append(False)
+
+    def record_failure(self, generation: int):
+        with self._lock:
+            state = self._current_state()
+            if generation != self._generation:
+                return
+            if state == HALF_OPEN:
+                self._transition(OPEN)
+            elif state == CLOSED:
+                self._outcomes.append(True)
+                failures = sum(self._outcomes)
+                if (len(self._outcomes) >= self.minimum_calls
+                        and failures / len(self._outcomes) >= self.failure_rate_threshold):
+                    self._transition(OPEN)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Estado actual del circuito (para diagnóstico y monitoreo).
+        """
+        with self._lock:
+            state = self._current_state()
+            calls = len(self._outcomes)
+            failures = sum(self._outcomes)
+            return {
+                'name': self.name,
+                'state': state,
+                'window_calls': calls,
+                'window_failures': failures,
+                'failure_rate': round(failures / calls, 3) if calls else 0.0,
+                'rejected_calls': self._rejected_calls,
+                'retry_in_seconds': (
+                    round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+                    if state == OPEN else None
+                )
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    Devuelve el circuit breaker del proceso para un servicio externo, creándolo la
+    primera vez con la configuración de CIRCUIT_BREAKER_SETTINGS (valores por defecto
+    en 'default', sobrescribibles por nombre).
+    """
+    breaker = _breakers.get(name)
+    if breaker is not None:
+        return breaker
+
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            config = getattr(settings, 'CIRCUIT_BREAKER_SETTINGS', {})
+            options = {**config.get('default', {}), **config.get(name, {})}
+            breaker = CircuitBreaker(name, **options)
+            _breakers[name] = breaker
+        return breaker
+
+
+def get_circuit_breakers_state() -> List[Dict[str, Any]]:
+    """
+    Estado de todos los circuit breakers creados en el proceso.
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.snapshot() for breaker in breakers]
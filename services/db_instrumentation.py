@@ -0,0 +1,247 @@
+import re
+import time
+import logging
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional
+
+import pymysql
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('conquerpass.slow_query')
+
+# Máximo de consultas detalladas que se guardan por colección (el resumen cuenta todas)
+MAX_RECORDED_QUERIES = 200
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|\?')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+def fingerprint(sql: str) -> str:
+    """
+    Normaliza una sentencia SQL para agrupar las ejecuciones de la misma consulta:
+    colapsa espacios, sustituye literales y placeholders por '?' y reduce las
+    listas IN (?, ?, ...) a IN (...), de modo que el tamaño del lote no cambie la huella.
+    """
+    normalized = _WHITESPACE_RE.sub(' ', sql).strip()
+    normalized = _STRING_RE.sub('?', normalized)
+    normalized = _NUMBER_RE.sub('?', normalized)
+    normalized = _PLACEHOLDER_RE.sub('?', normalized)
+    normalized = _IN_LIST_RE.sub('(...)', normalized)
+    return normalized
+
+
+class QueryStats:
+    """
+    Estadísticas de las consultas ejecutadas dentro de una colección (normalmente un request).
+    """
+
+    def __init__(self, capture_statements: bool = False):
+        """
+        Args:
+            capture_statements: Guardar la primera sentencia (SQL y parámetros) de cada huella
+        """
+        self.capture_statements = capture_statements
+        self.statements: Dict[str, tuple] = {}
+        self.query_count = 0
+        self.total_time = 0.0  # segundos
+        self.total_rows = 0
+        self.slow_query_count = 0
+        self.queries: List[Dict[str, Any]] = []
+
+    def record(self, statement_fingerprint: str, duration: float, rowcount: int, server: str):
+        self.query_count += 1
+        self.total_time += duration
+        self.total_rows += max(rowcount, 0)
+        if len(self.queries) < MAX_RECORDED_QUERIES:
+            self.queries.append({
+                'fingerprint': statement_fingerprint,
+                'duration_ms': round(duration * 1000, 2),
+                'rows': rowcount,
+                'server': server
+            })
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Resumen para adjuntar a los logs del request.
+        """
+        return {
+            'query_count': self.query_count,
+            'total_time_ms': round(self.total_time * 1000, 2),
+            'total_rows': self.total_rows,
+            'slow_query_count': self.slow_query_count
+        }
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar('wordpress_query_stats', default=None)
+
+
+def start_query_collection(capture_statements: bool = False) -> tuple:
+    """
+    Empieza a recolectar estadísticas en el contexto actual (hilo o tarea asyncio).
+
+    Args:
+        capture_statements: Guardar la primera sentencia de cada huella (ver QueryStats)
+
+    Returns:
+        Tupla (QueryStats, token); el token se pasa a stop_query_collection()
+    """
+    stats = QueryStats(capture_statements=capture_statements)
+    token = _current_stats.set(stats)
+    return stats, token
+
+
+def stop_query_collection(token) -> None:
+    _current_stats.reset(token)
+
+
+def get_current_query_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+class DeadlineExceeded(Exception):
+    """
+    Se agotó el presupuesto de tiempo del request para consultas a WordPress.
+    """
+
+
+# Instante (time.monotonic) en que vence el presupuesto del contexto actual; None = sin límite
+_current_deadline: ContextVar[Optional[float]] = ContextVar('wordpress_deadline', default=None)
+
+
+def start_deadline(seconds: Optional[float]) -> tuple:
+    """
+    Fija el presupuesto de tiempo del contexto actual (hilo o tarea asyncio) para las
+    consultas a WordPress. Un presupuesto ya activo más corto se respeta.
+
+    Args:
+        seconds: Segundos disponibles desde ahora; None o 0 = sin límite
+
+    Returns:
+        Token para stop_deadline()
+    """
+    deadline = time.monotonic() + seconds if seconds else None
+    current = _current_deadline.get()
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    return _current_deadline.set(deadline)
+
+
+def stop_deadline(token) -> None:
+    _current_deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """
+    Segundos que quedan del presupuesto actual (puede ser negativo), o None sin límite.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline() -> None:
+    """
+    Lanza DeadlineExceeded si el presupuesto actual está agotado.
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(
+            f"Presupuesto de tiempo del request agotado ({-remaining * 1000:.0f} ms excedidos)"
+        )
+
+
+class InstrumentedCursor:
+    """
+    Cursor que mide cada consulta, la registra en la colección activa y envía al
+    logger de consultas lentas las que superan WORDPRESS_SLOW_QUERY_MS. Antes de cada
+    consulta verifica el presupuesto de tiempo del request (ver start_deadline).
+    """
+
+    def __init__(self, cursor, server: str):
+        self._cursor = cursor
+        self._server = server
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+    def _timed(self, method, sql: str, args):
+        # Sin presupuesto no se encola más trabajo en MySQL
+        check_deadline()
+
+        # La espera por la respuesta tampoco puede pasar del presupuesto: el read_timeout
+        # de la conexión se acota a lo que queda mientras dura la consulta
+        remaining = remaining_time()
+        connection = getattr(self._cursor, 'connection', None)
+        read_timeout = getattr(connection, '_read_timeout', None)
+        capped = remaining is not None and (read_timeout is None or remaining < read_timeout)
+        if capped:
+            connection._read_timeout = remaining
+
+        start = time.perf_counter()
+        try:
+            return method(sql, args)
+        except pymysql.err.OperationalError as e:
+            if capped and remaining_time() <= 0:
+                raise DeadlineExceeded(
+                    f"Presupuesto de tiempo del request agotado esperando la respuesta de MySQL ({e})"
+                ) from e
+            raise
+        finally:
+            if capped:
+                connection._read_timeout = read_timeout
+            duration = time.perf_counter() - start
+            self._record(sql, args, duration)
+
+    def _record(self, sql: str, args, duration: float):
+        rowcount = getattr(self._cursor, 'rowcount', -1) or 0
+        statement_fingerprint = fingerprint(sql)
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.record(statement_fingerprint, duration, rowcount, self._server)
+            if stats.capture_statements:
+                stats.statements.setdefault(statement_fingerprint, (sql, args))
+
+        threshold_ms = getattr(settings, 'WORDPRESS_SLOW_QUERY_MS', 200)
+        if threshold_ms is not None and duration * 1000 >= threshold_ms:
+            if stats is not None:
+                stats.slow_query_count += 1
+            slow_query_logger.warning(
+                f"[SLOW QUERY] {duration * 1000:.1f} ms, {rowcount} filas, {self._server}: {statement_fingerprint}"
+            )
+
+    def execute(self, sql: str, args=None):
+        return self._timed(self._cursor.execute, sql, args)
+
+    def executemany(self, sql: str, args):
+        return self._timed(self._cursor.executemany, sql, args)
+
+
+class InstrumentedConnection:
+    """
+    Envoltorio de una conexión cuyos cursores son InstrumentedCursor. El resto de
+    operaciones (commit, rollback, close...) se delegan en la conexión original.
+    """
+
+    def __init__(self, connection, server: str = 'primary'):
+        self._connection = connection
+        self._server = server
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs), self._server)
@@ -1,11 +1,57 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable
 import logging
 from datetime import datetime, timedelta
+from services.cache_utils import VersionedCache
+from services.single_flight import SingleFlight
+from services.circuit_breaker import get_circuit_breaker, circuit_open_result
 
 logger = logging.getLogger(__name__)
 
+# Sesión HTTP compartida por todas las instancias de DLocalService del proceso
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+# GETs idénticos en curso en el proceso comparten una sola petición a la API
+_in_flight_reads = SingleFlight('dlocal')
+
+
+def get_session() -> requests.Session:
+    """
+    Devuelve la sesión HTTP del proceso para la API de dLocal, creándola la primera vez.
+    Reutiliza las conexiones (keep-alive) para no pagar un handshake TLS por petición.
+    Tras un fork (p. ej. gunicorn con preload) se crea una sesión nueva: los sockets
+    del proceso padre no se comparten.
+    """
+    global _session, _session_pid
+    
+    if _session is not None and _session_pid == os.getpid():
+        return _session
+    
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            pool_size = getattr(settings, 'DLOCAL_HTTP_POOL_SIZE', 10)
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=pool_size,
+                # Solo se reintentan los fallos de conexión (la petición no llegó a enviarse);
+                # read=False deja pasar ReadTimeout tal cual en lugar de envolverlo
+                max_retries=Retry(total=1, connect=1, read=False, status=0, other=0, redirect=0)
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
 
 class DLocalService:
     """
@@ -29,6 +75,55 @@ class DLocalService:
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.api_key}:{self.secret_key}'
         }
+        
+        # (conexión, lectura) en segundos
+        self.timeout = (
+            getattr(settings, 'DLOCAL_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'DLOCAL_READ_TIMEOUT', 15)
+        )
+        self.session = get_session()
+        
+        # Detalles y ejecuciones por suscripción, compartidos entre requests: la página de
+        # cambio de método y el POST posterior piden lo mismo con segundos de diferencia
+        self._cache = VersionedCache(
+            prefix='dlocal',
+            alias=getattr(settings, 'DLOCAL_CACHE_ALIAS', 'dlocal'),
+            timeout=getattr(settings, 'DLOCAL_CACHE_TTL', 30)
+        )
+    
+    def _subscription_cache_group(self, plan_id: int, subscription_id: int) -> str:
+        """
+        Grupo de caché de una suscripción. Incluye la versión global, de modo que
+        invalidar el grupo 'all' descarta las entradas de todas las suscripciones.
+        """
+        return f"{self._cache.version('all')}:{plan_id}:{subscription_id}"
+    
+    def _cached_subscription_call(self, key: str, plan_id: int, subscription_id: int,
+                                  loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Resuelve una lectura de una suscripción desde la caché o con loader. Solo se
+        guardan los resultados exitosos.
+        """
+        group = self._subscription_cache_group(plan_id, subscription_id)
+        result = self._cache.get(group, key)
+        if result is not None:
+            return result
+        
+        # La versión se toma antes de la petición (ver VersionedCache.version)
+        version = self._cache.version(group)
+        result = loader()
+        if result['success']:
+            self._cache.set(group, key, result, version=version)
+        return result
+    
+    def invalidate_subscription_cache(self, plan_id: Optional[int] = None, subscription_id: Optional[int] = None):
+        """
+        Descarta de la caché los datos de una suscripción o, sin argumentos, los de todas.
+        """
+        if plan_id is None or subscription_id is None:
+            self._cache.invalidate('all')
+        else:
+            self._cache.invalidate(self._subscription_cache_group(plan_id, subscription_id))
     
     def _make_request(self, method: str, endpoint: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
         """
@@ -42,15 +137,43 @@ class DLocalService:
         Returns:
             Dict con la respuesta de la API o información de error
         """
+        url = f"{self.base_url}{endpoint}"
+        if method.upper() == 'GET':
+            key = (self.api_key, url, tuple(sorted((data or {}).items())))
+            return _in_flight_reads.do(key, lambda: self._send_guarded_request(method, url, data))
+        return self._send_guarded_request(method, url, data)
+    
+    def _send_guarded_request(self, method: str, url: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Envía la petición a través del circuit breaker de dLocal: con el circuito abierto
+        falla de inmediato con error_type 'CircuitOpen' sin tocar la red.
+        """
+        breaker = get_circuit_breaker('dlocal')
+        generation = breaker.allow_request()
+        if generation is None:
+            return circuit_open_result('dlocal')
+        
+        result = self._send_request(method, url, data)
+        
+        # Los 4xx son respuestas de una API sana; los 5xx, 429 y los errores de red no
+        status_code = result.get('status_code') or 0
+        if result['success'] or (400 <= status_code < 500 and status_code != 429):
+            breaker.record_success(generation)
+        else:
+            breaker.record_failure(generation)
+        return result
+    
+    def _send_request(self, method: str, url: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Envía la petición HTTP de _make_request y traduce la respuesta o el error.
+        """
         try:
-            url = f"{self.base_url}{endpoint}"
-            
             if method.upper() == 'GET':
-                response = requests.get(url, headers=self.headers, params=data)
+                response = self.session.get(url, headers=self.headers, params=data, timeout=self.timeout)
             elif method.upper() == 'POST':
-                response = requests.post(url, headers=self.headers, json=data)
+                response = self.session.post(url, headers=self.headers, json=data, timeout=self.timeout)
             elif method.upper() == 'PATCH':
-                response = requests.patch(url, headers=self.headers, json=data)
+                response = self.session.patch(url, headers=self.headers, json=data, timeout=self.timeout)
             else:
                 return {
                     'success': False,
@@ -80,14 +203,7 @@ class DLocalService:
                     'error_data': error_data
                 }
                 
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f"Error de conexión con dLocal API: {str(e)}")
-            return {
-                'success': False,
-                'error': 'Error de conexión con el servicio de pagos. Por favor, intenta nuevamente.',
-                'error_type': 'ConnectionError',
-                'original_error': str(e)
-            }
+        # Antes que ConnectionError: ConnectTimeout es subclase de ambas
         except requests.exceptions.Timeout as e:
             logger.error(f"Timeout en dLocal API: {str(e)}")
             return {
@@ -96,6 +212,14 @@ class DLocalService:
                 'error_type': 'TimeoutError',
                 'original_error': str(e)
             }
+        except requests.exceptions.ConnectionError as e:
+            logger.error(f"Error de conexión con dLocal API: {str(e)}")
+            return {
+                'success': False,
+                'error': 'Error de conexión con el servicio de pagos. Por favor, intenta nuevamente.',
+                'error_type': 'ConnectionError',
+                'original_error': str(e)
+            }
         except Exception as e:
             logger.error(f"Error inesperado en dLocal API: {str(e)}")
             return {
@@ -127,6 +251,72 @@ class DLocalService:
         
         return self._make_request('GET', endpoint, params)
     
+    def get_all_subscription_executions(self, plan_id: int, subscription_id: int,
+                                        page_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Obtiene todas las ejecuciones de una suscripción. Pide la primera página, calcula
+        con total_elements cuántas faltan y las pide en paralelo (como máximo
+        DLOCAL_PAGINATION_WORKERS a la vez), de modo que el historial completo cuesta
+        aproximadamente la latencia de dos peticiones en lugar de una por página.
+        
+        Args:
+            plan_id: ID del plan
+            subscription_id: ID de la suscripción
+            page_size: Elementos por página (default: DLOCAL_EXECUTIONS_PAGE_SIZE)
+            
+        Returns:
+            Dict con la misma forma que get_subscription_executions y todas las
+            ejecuciones en 'data', en el orden de las páginas; si falla alguna página,
+            su información de error
+        """
+        page_size = page_size or getattr(settings, 'DLOCAL_EXECUTIONS_PAGE_SIZE', 50)
+        return self._cached_subscription_call(
+            f'executions:{page_size}', plan_id, subscription_id,
+            lambda: self._fetch_all_subscription_executions(plan_id, subscription_id, page_size)
+        )
+    
+    def _fetch_all_subscription_executions(self, plan_id: int, subscription_id: int,
+                                           page_size: int) -> Dict[str, Any]:
+        """
+        Implementación de get_all_subscription_executions (sin caché).
+        """
+        first_result = self.get_subscription_executions(plan_id, subscription_id, page=1, page_size=page_size)
+        if not first_result['success']:
+            return first_result
+        
+        first_page = first_result['data']
+        executions = list(first_page.get('data', []))
+        total_elements = first_page.get('total_elements') or len(executions)
+        if not executions or len(executions) >= total_elements:
+            return first_result
+        
+        # La API puede devolver menos elementos que los pedidos: el tamaño real de página
+        # es el de la primera respuesta
+        effective_page_size = len(executions)
+        total_pages = -(-total_elements // effective_page_size)
+        remaining_pages = range(2, total_pages + 1)
+        
+        max_workers = min(getattr(settings, 'DLOCAL_PAGINATION_WORKERS', 4), len(remaining_pages))
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='dlocal-pages') as executor:
+            page_results = list(executor.map(
+                lambda page: self.get_subscription_executions(
+                    plan_id, subscription_id, page=page, page_size=effective_page_size
+                ),
+                remaining_pages
+            ))
+        
+        for page, page_result in zip(remaining_pages, page_results):
+            if not page_result['success']:
+                logger.error(f"Error obteniendo la página {page} de ejecuciones de la suscripción {subscription_id}: {page_result['error']}")
+                return page_result
+            executions.extend(page_result['data'].get('data', []))
+        
+        return {
+            'success': True,
+            'data': {**first_page, 'data': executions, 'total_elements': total_elements},
+            'status_code': first_result['status_code']
+        }
+    
     def get_single_execution(self, subscription_id: int, execution_id: str) -> Dict[str, Any]:
         """
         Obtiene una ejecución específica de una suscripción.
@@ -154,8 +344,17 @@ class DLocalService:
         Returns:
             Dict con los detalles de la suscripción incluyendo próxima cuota
         """
-        # Obtener ejecuciones de la suscripción
-        executions_result = self.get_subscription_executions(plan_id, subscription_id)
+        return self._cached_subscription_call(
+            'details', plan_id, subscription_id,
+            lambda: self._fetch_subscription_details(plan_id, subscription_id)
+        )
+    
+    def _fetch_subscription_details(self, plan_id: int, subscription_id: int) -> Dict[str, Any]:
+        """
+        Implementación de get_subscription_details (sin caché).
+        """
+        # Obtener todas las ejecuciones de la suscripción (el próximo pago depende del historial completo)
+        executions_result = self.get_all_subscription_executions(plan_id, subscription_id)
         
         if not executions_result['success']:
             return executions_result
@@ -328,19 +527,27 @@ class DLocalService:
                 'reason': f'Error en cálculo: {str(e)}'
             }
     
-    def create_plan(self, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+    def create_plan(self, plan_data: Dict[str, Any], replaced_plan_id: Optional[int] = None,
+                    replaced_subscription_id: Optional[int] = None) -> Dict[str, Any]:
         """
         Crea un nuevo plan en dLocal.
         
         Args:
             plan_data: Datos del plan a crear
+            replaced_plan_id: Plan de la suscripción que reemplaza el nuevo plan (opcional)
+            replaced_subscription_id: Suscripción que reemplaza el nuevo plan (opcional);
+                si se indica junto con replaced_plan_id, su caché se invalida
             
         Returns:
             Dict con el plan creado o información de error
         """
         endpoint = "/v1/subscription/plan"
         
-        return self._make_request('POST', endpoint, plan_data)
+        result = self._make_request('POST', endpoint, plan_data)
+        if result['success'] and replaced_plan_id is not None and replaced_subscription_id is not None:
+            # Solo cambia la suscripción reemplazada; las demás siguen en caché
+            self.invalidate_subscription_cache(replaced_plan_id, replaced_subscription_id)
+        return result
     
     def cancel_subscription(self, plan_id: int, subscription_id: int) -> Dict[str, Any]:
         """
@@ -355,7 +562,10 @@ class DLocalService:
         """
         endpoint = f"/v1/subscription/plan/{plan_id}/subscription/{subscription_id}/deactivate"
         
-        return self._make_request('PATCH', endpoint)
+        result = self._make_request('PATCH', endpoint)
+        # Aunque falle, el estado remoto puede haber cambiado
+        self.invalidate_subscription_cache(plan_id, subscription_id)
+        return result
     
     def test_connection(self) -> Dict[str, Any]:
         """
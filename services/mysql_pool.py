@@ -0,0 +1,287 @@
+import os
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, Any, Tuple, Optional
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """
+    No se obtuvo una conexión libre del pool dentro del tiempo de espera.
+    """
+
+
+class PooledConnection:
+    """
+    Conexión pymysql prestada por el pool.
+
+    Delega todo en la conexión real excepto close(), que la devuelve al pool
+    en lugar de cerrarla. Así el código existente (try/finally con
+    connection.close()) funciona igual con o sin pool.
+    """
+
+    def __init__(self, pool: 'MySQLConnectionPool', raw, created_at: float):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        """
+        Devuelve la conexión al pool. Llamadas repetidas no tienen efecto.
+        """
+        if not self._released:
+            self._released = True
+            self._pool._release(self._raw, self._created_at)
+
+
+class MySQLConnectionPool:
+    """
+    Pool de conexiones MySQL acotado y seguro entre hilos.
+
+    - Nunca abre más de max_size conexiones; si están todas prestadas, espera
+      hasta acquire_timeout segundos antes de lanzar PoolTimeoutError.
+    - Verifica con ping() que la conexión siga viva al prestarla.
+    - Recicla las conexiones que superan max_age segundos de vida.
+    - Mantiene abiertas al menos min_size conexiones desde su creación.
+    """
+
+    def __init__(self, db_config: Dict[str, Any], min_size: int = 0, max_size: int = 10,
+                 max_age: float = 3600, acquire_timeout: float = 10):
+        self.db_config = dict(db_config)
+        self.max_size = max(1, max_size)
+        self.min_size = min(max(0, min_size), self.max_size)
+        self.max_age = max_age
+        self.acquire_timeout = acquire_timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conexión, created_at)
+        self._size = 0  # conexiones abiertas: libres + prestadas
+        self._pid = os.getpid()
+
+        self._fill_to_min_size()
+
+    def _connect(self, time_limit: Optional[float] = None):
+        """
+        Abre una conexión. Con time_limit, la conexión y el handshake no esperan más que
+        eso (los timeouts configurados se acotan y se restauran después).
+        """
+        if time_limit is None:
+            return pymysql.connect(**self.db_config)
+
+        limited_config = dict(self.db_config)
+        for key in ('connect_timeout', 'read_timeout', 'write_timeout'):
+            configured = self.db_config.get(key)
+            limited_config[key] = time_limit if configured is None else min(configured, time_limit)
+        raw = pymysql.connect(**limited_config)
+        # connect_timeout solo se usaría al reconectar, y el pool nunca reconecta
+        raw._read_timeout = self.db_config.get('read_timeout')
+        raw._write_timeout = self.db_config.get('write_timeout')
+        return raw
+
+    def _close_quietly(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _fill_to_min_size(self):
+        """
+        Abre conexiones hasta alcanzar min_size. Los errores se registran pero
+        no se propagan: el pool sigue siendo usable y abrirá bajo demanda.
+        """
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                raw = self._connect()
+            except Exception as e:
+                with self._cond:
+                    self._size -= 1
+                logger.warning(f"No se pudo precalentar el pool de WordPress DB: {str(e)}")
+                return
+            with self._cond:
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+
+    def _check_fork(self):
+        """
+        Tras un fork (p. ej. gunicorn con preload) las conexiones heredadas no
+        se pueden compartir con el proceso padre: se descartan sin cerrarlas.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._size = 0
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.max_age is not None and (time.monotonic() - created_at) > self.max_age
+
+    def _is_usable(self, raw, created_at: float, time_limit: Optional[float] = None) -> bool:
+        if self._is_expired(created_at):
+            return False
+
+        # Con time_limit, un servidor colgado no retiene el ping más que eso
+        timeouts = (getattr(raw, '_read_timeout', None), getattr(raw, '_write_timeout', None))
+        if time_limit is not None:
+            raw._read_timeout, raw._write_timeout = (
+                time_limit if configured is None else min(configured, time_limit) for configured in timeouts
+            )
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+        finally:
+            if time_limit is not None:
+                raw._read_timeout, raw._write_timeout = timeouts
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        Presta una conexión del pool, abriendo una nueva si hay capacidad.
+
+        Args:
+            timeout: Tiempo máximo de la operación completa (espera por una conexión libre,
+                ping y apertura); la espera tampoco supera acquire_timeout
+
+        Returns:
+            PooledConnection: Conexión lista para usar; close() la devuelve al pool
+
+        Raises:
+            PoolTimeoutError: Si el pool está lleno durante todo el tiempo de espera
+            Exception: Si no se puede abrir una conexión nueva
+        """
+        started = time.monotonic()
+        wait = self.acquire_timeout if timeout is None else max(0.0, min(timeout, self.acquire_timeout))
+        deadline = started + wait
+        raw = None
+        created_at = 0.0
+
+        with self._cond:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    # LIFO: la conexión usada más recientemente es la más probable de seguir viva
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"Pool de WordPress DB agotado ({self.max_size} conexiones en uso)"
+                    )
+                self._cond.wait(remaining)
+
+        def time_left():
+            # pymysql exige timeouts positivos: sin tiempo, el ping o la apertura fallan enseguida
+            return None if timeout is None else max(0.001, started + timeout - time.monotonic())
+
+        # La verificación y la apertura se hacen fuera del lock; el hueco ya está reservado
+        if raw is not None and not self._is_usable(raw, created_at, time_left()):
+            self._close_quietly(raw)
+            raw = None
+
+        if raw is None:
+            try:
+                raw = self._connect(time_left())
+                created_at = time.monotonic()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw, created_at: float):
+        """
+        Recibe una conexión devuelta. Se hace rollback para cerrar cualquier
+        transacción abierta (y su snapshot de lectura) antes de reutilizarla.
+        """
+        keep = not self._is_expired(created_at)
+        if keep:
+            try:
+                raw.rollback()
+            except Exception:
+                keep = False
+
+        if not keep:
+            self._close_quietly(raw)
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if keep:
+                self._idle.append((raw, created_at))
+            else:
+                self._size -= 1
+            self._cond.notify()
+
+        if not keep and self._size < self.min_size:
+            self._fill_to_min_size()
+
+    def close_all(self):
+        """
+        Cierra las conexiones libres. Las prestadas se cierran al devolverse
+        si han expirado; el resto vuelve al pool normalmente.
+        """
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for raw, _ in idle:
+            self._close_quietly(raw)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Estado actual del pool (útil para logs y diagnóstico).
+        """
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+                'min_size': self.min_size,
+            }
+
+
+_pools: Dict[Tuple, MySQLConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_config: Dict[str, Any], **options) -> MySQLConnectionPool:
+    """
+    Devuelve el pool compartido del proceso para una configuración de conexión,
+    creándolo la primera vez.
+
+    Args:
+        db_config: Parámetros para pymysql.connect
+        **options: min_size, max_size, max_age y acquire_timeout del pool
+
+    Returns:
+        MySQLConnectionPool compartido por todas las instancias con la misma configuración
+    """
+    key = tuple(sorted(db_config.items()))
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = MySQLConnectionPool(db_config, **options)
+            _pools[key] = pool
+        return pool
@@ -0,0 +1,27 @@
+from typing import Any, Callable
+
+from asgiref.sync import sync_to_async
+
+
+class ThreadServiceAdapter:
+    """
+    Envoltorio de un servicio síncrono cuyos métodos son corrutinas: cada llamada se
+    ejecuta en un hilo con sync_to_async, así que el event loop queda libre mientras la
+    API externa responde. El servicio se crea con factory en el primer uso.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._service = None
+
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = self._factory()
+        return self._service
+
+    def __getattr__(self, name):
+        method = getattr(self.service, name)
+        if not callable(method):
+            return method
+        return sync_to_async(method)
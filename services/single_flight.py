@@ -0,0 +1,91 @@
+import copy
+import threading
+import logging
+from typing import Any, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """
+    Llamada en curso de un SingleFlight.
+    """
+    __slots__ = ('event', 'waiters', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalescencia de llamadas idénticas dentro del proceso: mientras una llamada con
+    una clave está en curso, las demás llamadas con la misma clave esperan su
+    resultado en lugar de repetirla.
+
+    Pensado para lecturas a APIs externas (doble clic, varias pestañas, campañas de
+    email): reduce la carga y la exposición a límites de tasa. No es una caché: en
+    cuanto la llamada termina, la siguiente con la misma clave vuelve a ejecutarse.
+    Cada llamador que espera recibe su propia copia del resultado, de modo que
+    modificarlo no afecta a los demás.
+    """
+
+    def __init__(self, name: str = 'single-flight'):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Ejecuta func, o espera a la ejecución en curso con la misma clave.
+
+        Args:
+            key: Identifica la llamada (debe incluir todo lo que cambia el resultado)
+            func: Llamada sin argumentos
+
+        Returns:
+            El resultado de func (una copia para quienes esperaron)
+
+        Raises:
+            La excepción de func, también para quienes esperaron
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        result = None
+        try:
+            result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            try:
+                if waiters and call.error is None:
+                    # Copia antes de liberar a los demás: quien lanzó la llamada puede
+                    # modificar su resultado en cuanto lo recibe
+                    call.result = copy.deepcopy(result)
+                    logger.debug(f"[{self.name}] Resultado compartido con {waiters} llamadas idénticas")
+            except Exception as e:
+                call.error = e
+            finally:
+                call.event.set()
+
+        return result
@@ -0,0 +1,147 @@
+from typing import Dict, Any, Optional, Sequence
+
+# Columnas base de wp_wc_orders, en el orden en que las seleccionan las consultas
+ORDER_FIELDS = (
+    'id',
+    'status',
+    'date_created_gmt',
+    'billing_email',
+    'total_amount',
+    'payment_method',
+    'payment_method_title',
+    'type',
+)
+
+
+def order_select_columns(alias: str = 'o') -> str:
+    """
+    Lista SELECT de ORDER_FIELDS para una tabla wp_wc_orders con el alias indicado.
+    """
+    return ', '.join(f'{alias}.{field}' for field in ORDER_FIELDS)
+
+
+class _RecordMapping:
+    """
+    Acceso tipo dict a los campos de un registro con __slots__ (order['id'],
+    order.get('metadata_dict', {}), dict(order)...), para el código y las plantillas
+    que trabajan con los dicts de DictCursor.
+    """
+    __slots__ = ()
+    __slots_all__ = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots_all__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self.__slots_all__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__slots_all__
+
+    def __iter__(self):
+        return iter(self.__slots_all__)
+
+    def __len__(self) -> int:
+        return len(self.__slots_all__)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self.__slots_all__:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return self.__slots_all__
+
+    def values(self):
+        return [getattr(self, key) for key in self.__slots_all__]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots_all__]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, _RecordMapping):
+            return type(self) is type(other) and self.items() == other.items()
+        return NotImplemented
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return tuple(getattr(self, key) for key in self.__slots_all__)
+
+    def __setstate__(self, state):
+        for key, value in zip(self.__slots_all__, state):
+            setattr(self, key, value)
+
+
+class Order(_RecordMapping):
+    """
+    Orden de WooCommerce (wp_wc_orders) con sus metadatos.
+    """
+    __slots__ = ORDER_FIELDS + ('metadata_dict',)
+    __slots_all__ = __slots__
+
+    def __init__(self, id: int, status: Optional[str] = None, date_created_gmt=None,
+                 billing_email: Optional[str] = None, total_amount=None,
+                 payment_method: Optional[str] = None, payment_method_title: Optional[str] = None,
+                 type: Optional[str] = None, metadata_dict: Optional[Dict[str, str]] = None):
+        self.id = id
+        self.status = status
+        self.date_created_gmt = date_created_gmt
+        self.billing_email = billing_email
+        self.total_amount = total_amount
+        self.payment_method = payment_method
+        self.payment_method_title = payment_method_title
+        self.type = type
+        self.metadata_dict = metadata_dict if metadata_dict is not None else {}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(id={self.id!r}, status={self.status!r})"
+
+    @classmethod
+    def from_row(cls, row: Sequence) -> 'Order':
+        """
+        Crea el registro desde una fila de cursor de tuplas que empieza por ORDER_FIELDS.
+        """
+        return cls(*row[:len(ORDER_FIELDS)])
+
+
+class Installment(Order):
+    """
+    Cuota de un plan: orden enlazada a su orden madre por los metadatos
+    '_asp_upp_initial_payment' / '_asp_upp_schedule_payment'.
+    """
+    __slots__ = ('parent_order_id', 'payment_number')
+    __slots_all__ = Order.__slots_all__ + __slots__
+
+    def __init__(self, id: int, *args, parent_order_id: Optional[int] = None, **kwargs):
+        super().__init__(id, *args, **kwargs)
+        self.parent_order_id = parent_order_id
+        self.payment_number = parse_payment_number(self.metadata_dict)
+
+    @classmethod
+    def from_row(cls, row: Sequence, parent_order_id: Optional[int] = None) -> 'Installment':
+        return cls(*row[:len(ORDER_FIELDS)], parent_order_id=parent_order_id)
+
+    def set_metadata(self, metadata_dict: Dict[str, str]):
+        """
+        Asigna los metadatos y recalcula payment_number.
+        """
+        self.metadata_dict = metadata_dict
+        self.payment_number = parse_payment_number(metadata_dict)
+
+
+def parse_payment_number(metadata_dict: Dict[str, str]) -> int:
+    """
+    Número de cuota ('_asp_upp_payment_number'); 0 si falta o no es numérico.
+    """
+    try:
+        return int(metadata_dict.get('_asp_upp_payment_number', 0))
+    except (TypeError, ValueError):
+        return 0
@@ -1,10 +1,89 @@
+import sys
 import pymysql
 from django.conf import settings
-from typing import Dict, List, Any, Optional
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Any, Optional, Iterable, Tuple, Callable, Set
 import logging
+from services.mysql_pool import get_pool
+from services.cache_utils import VersionedCache, hash_key
+from services.db_instrumentation import InstrumentedConnection, DeadlineExceeded, check_deadline, remaining_time
+from services.wordpress_records import (
+    Order, Installment, ORDER_FIELDS, order_select_columns, parse_payment_number
+)
 
 logger = logging.getLogger(__name__)
 
+# Máximo de IDs por consulta IN (...) al cargar metadatos en lote
+METADATA_BATCH_SIZE = 500
+
+# Metadatos que enlazan una cuota (shop_order) con su orden madre (asp_shop_plan)
+INSTALLMENT_LINK_META_KEYS = ('_asp_upp_initial_payment', '_asp_upp_schedule_payment')
+
+# Nombre del estado de sincronización de la tabla local InstallmentLink
+INSTALLMENT_LINKS_SYNC_NAME = 'installment_links'
+
+# Nombre del estado de sincronización de la tabla local CustomerPaymentProfile
+PAYMENT_PROFILES_SYNC_NAME = 'customer_payment_profiles'
+
+# Columnas del estado de pago por plan que produce iter_payment_states()
+PAYMENT_STATE_FIELDS = (
+    'email',
+    'parent_order_id',
+    'parent_status',
+    'parent_date_created_gmt',
+    'installments_count',
+    'processing_installments_count',
+    'latest_processing_installment_id',
+    'latest_payment_number',
+    'payment_method',
+    'stripe_customer_id',
+    'stripe_source_id',
+    'dlocal_plan_id',
+    'dlocal_subscription_id',
+    'distinct_source_ids',
+    'stale_source_id_installments',
+)
+
+# Metadatos de una cuota que identifican el método de pago en el resumen de órdenes
+STRIPE_META_KEYS = ('_stripe_customer_id', '_stripe_source_id')
+DLOCAL_META_KEYS = ('_dlocal_current_plan_id', '_dlocal_current_subscription_id')
+
+# Proyección por defecto de metadatos: solo lo que necesita la resolución del método de pago.
+# Las entradas terminadas en '*' son prefijos.
+PAYMENT_META_KEYS = (
+    '_stripe_customer_id',
+    '_stripe_source_id',
+    '_dlocal_current_plan_id',
+    '_dlocal_current_subscription_id',
+    '_asp_upp_payment_number',
+    '_asp_upp_*',
+)
+
+
+def next_installment_after(structured_result: Dict[str, Any],
+                           installment: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Cuota siguiente a installment dentro de su mismo plan, buscada en el índice
+    (parent_order_id, payment_number) del resultado de get_customer_orders_structured.
+    
+    Args:
+        structured_result: Resultado de get_customer_orders_structured
+        installment: Cuota de referencia, con parent_order_id y payment_number
+        
+    Returns:
+        La cuota con el número siguiente en el mismo plan, o None si no hay
+    """
+    if not installment:
+        return None
+    installment_index = structured_result.get('installment_index') or {}
+    return installment_index.get(
+        (installment.get('parent_order_id'), (installment.get('payment_number') or 0) + 1)
+    )
+
 
 class WordPressService:
     """
@@ -19,49 +98,305 @@ class WordPressService:
         host = getattr(settings, 'WORDPRESS_DB_HOST', 'localhost')
         port = getattr(settings, 'WORDPRESS_DB_PORT', 3306)
         
-        # Configuración base
-        self.wp_db_config = {
-            'user': getattr(settings, 'WORDPRESS_DB_USER', ''),
-            'password': getattr(settings, 'WORDPRESS_DB_PASSWORD', ''),
-            'database': getattr(settings, 'WORDPRESS_DB_NAME', ''),
-            'charset': 'utf8mb4'
+        # Configuración base (primaria: lecturas y escrituras)
+        self.wp_db_config = self._build_db_config(
+            host=host,
+            port=port,
+            user=getattr(settings, 'WORDPRESS_DB_USER', ''),
+            password=getattr(settings, 'WORDPRESS_DB_PASSWORD', ''),
+            database=getattr(settings, 'WORDPRESS_DB_NAME', '')
+        )
+        
+        # Réplica de lectura opcional; usuario, password y base por defecto los de la primaria
+        replica_host = getattr(settings, 'WORDPRESS_DB_REPLICA_HOST', '')
+        self.wp_replica_db_config = None
+        if replica_host:
+            self.wp_replica_db_config = self._build_db_config(
+                host=replica_host,
+                port=getattr(settings, 'WORDPRESS_DB_REPLICA_PORT', None) or port,
+                user=getattr(settings, 'WORDPRESS_DB_REPLICA_USER', '') or self.wp_db_config['user'],
+                password=getattr(settings, 'WORDPRESS_DB_REPLICA_PASSWORD', '') or self.wp_db_config['password'],
+                database=getattr(settings, 'WORDPRESS_DB_REPLICA_NAME', '') or self.wp_db_config['database']
+            )
+        
+        # Ventana read-your-writes: tras escribir en los datos de un email, sus lecturas
+        # van a la primaria durante estos segundos para no ver el retraso de la réplica
+        self.read_your_writes_seconds = getattr(settings, 'WORDPRESS_DB_READ_YOUR_WRITES_SECONDS', 5)
+        self._written_emails = set()
+        
+        # Snapshots memoizados de esta instancia (una instancia por request), por email.
+        # Cualquier escritura de metadatos los invalida.
+        self._snapshots: Dict[Tuple, Dict[str, Any]] = {}
+        
+        # Caché de snapshots compartida entre requests (framework de caché de Django)
+        self._snapshot_cache = VersionedCache(
+            prefix='wp:snapshot',
+            alias=getattr(settings, 'WORDPRESS_SNAPSHOT_CACHE_ALIAS', 'default'),
+            timeout=getattr(settings, 'WORDPRESS_SNAPSHOT_CACHE_TTL', 60)
+        )
+        
+        # Última versión buena de cada snapshot, que las escrituras no invalidan: solo se
+        # sirve (marcada 'stale') si se agota el presupuesto de tiempo del request
+        self._stale_snapshot_cache = VersionedCache(
+            prefix='wp:snapshot-stale',
+            alias=getattr(settings, 'WORDPRESS_SNAPSHOT_CACHE_ALIAS', 'default'),
+            timeout=getattr(settings, 'WORDPRESS_STALE_SNAPSHOT_TTL', 3600)
+        )
+        
+        # Pools compartidos por todas las instancias del proceso
+        pool_options = {
+            'min_size': getattr(settings, 'WORDPRESS_DB_POOL_MIN_SIZE', 0),
+            'max_size': getattr(settings, 'WORDPRESS_DB_POOL_MAX_SIZE', 10),
+            'max_age': getattr(settings, 'WORDPRESS_DB_POOL_MAX_AGE', 3600),
+            'acquire_timeout': getattr(settings, 'WORDPRESS_DB_POOL_TIMEOUT', 10)
+        }
+        self._pool = get_pool(self.wp_db_config, **pool_options)
+        self._replica_pool = get_pool(self.wp_replica_db_config, **pool_options) if self.wp_replica_db_config else None
+    
+    def _build_db_config(self, host: str, port: Optional[int], user: str, password: str,
+                         database: str) -> Dict[str, Any]:
+        """
+        Construye los parámetros de pymysql.connect para un servidor.
+        """
+        db_config = {
+            'user': user,
+            'password': password,
+            'database': database,
+            'charset': 'utf8mb4',
+            # Sin timeouts una consulta colgada retiene el worker indefinidamente
+            'connect_timeout': getattr(settings, 'WORDPRESS_DB_CONNECT_TIMEOUT', 5),
+            'read_timeout': getattr(settings, 'WORDPRESS_DB_READ_TIMEOUT', 30),
+            'write_timeout': getattr(settings, 'WORDPRESS_DB_WRITE_TIMEOUT', 30)
         }
         
         # Determinar si es socket Unix o conexión TCP
         if host.startswith('/') or host.endswith('.sock'):
             # Es un socket Unix
-            self.wp_db_config['unix_socket'] = host
+            db_config['unix_socket'] = host
         else:
             # Es una conexión TCP normal
-            self.wp_db_config['host'] = host
-            self.wp_db_config['port'] = port if port else 3306
+            db_config['host'] = host
+            db_config['port'] = port if port else 3306
+        
+        return db_config
     
-    def _get_connection(self):
+    def _get_connection(self, read_only: bool = False, email: Optional[str] = None):
         """
-        Obtiene una conexión a la base de datos de WordPress.
+        Obtiene una conexión del pool de la base de datos de WordPress.
+        Al llamar a close() la conexión vuelve al pool en lugar de cerrarse.
+        
+        Args:
+            read_only (bool): La conexión solo se usará para lecturas; puede ir a la réplica
+            email (str, opcional): Email cuyos datos se leerán; si se escribió en ellos hace
+                poco (ventana read-your-writes) la lectura va a la primaria
         
         Returns:
-            pymysql.Connection: Conexión a la base de datos
+            PooledConnection: Conexión a la base de datos
             
         Raises:
+            DeadlineExceeded: Si el presupuesto de tiempo del request está agotado
             Exception: Si no se puede conectar a la base de datos
         """
+        pool, server = self._pool, 'primary'
+        if read_only and self._replica_pool is not None and not self._recently_written(email):
+            pool, server = self._replica_pool, 'replica'
+        
+        # La espera por una conexión libre tampoco puede pasar del presupuesto del request
+        check_deadline()
+        
         try:
-            connection = pymysql.connect(**self.wp_db_config)
+            # Los cursores de la conexión quedan instrumentados (tiempos, filas, consultas lentas)
+            connection = InstrumentedConnection(pool.acquire(timeout=remaining_time()), server=server)
             return connection
         except Exception as e:
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                # La espera, el ping o la apertura se cortaron por el presupuesto del request
+                raise DeadlineExceeded(
+                    f"Presupuesto de tiempo del request agotado obteniendo una conexión ({str(e)})"
+                ) from e
             logger.error(f"Error conectando a WordPress DB: {str(e)}")
             raise
     
+    def _read_your_writes_key(self, email: str) -> str:
+        return f"wp:ryw:{hash_key(email.strip().lower())}"
+    
+    def _recently_written(self, email: Optional[str]) -> bool:
+        """
+        Indica si se escribió en los datos del email dentro de la ventana read-your-writes,
+        en esta instancia o (vía la caché compartida) en cualquier otro request.
+        """
+        if not email:
+            return False
+        if email.strip().lower() in self._written_emails:
+            return True
+        try:
+            return bool(caches[self._snapshot_cache.alias].get(self._read_your_writes_key(email)))
+        except Exception as e:
+            logger.warning(f"Error leyendo ventana read-your-writes: {str(e)}")
+            return False
+    
+    def _mark_written(self, emails: Iterable[str]):
+        """
+        Abre la ventana read-your-writes para los emails afectados por una escritura.
+        """
+        for email in emails:
+            if not email:
+                continue
+            self._written_emails.add(email.strip().lower())
+            if self._replica_pool is None or not self.read_your_writes_seconds:
+                continue
+            try:
+                caches[self._snapshot_cache.alias].set(
+                    self._read_your_writes_key(email), True, self.read_your_writes_seconds
+                )
+            except Exception as e:
+                logger.warning(f"Error registrando ventana read-your-writes: {str(e)}")
+    
+    def _snapshot_key(self, kind: str, email: str, meta_keys: Optional[Iterable[str]]) -> Tuple:
+        """
+        Clave de memoización: tipo de consulta, email normalizado y proyección de metadatos.
+        """
+        projection = None if meta_keys is None else tuple(sorted(meta_keys))
+        return (kind, email.strip().lower(), projection)
+    
+    def _load_snapshot(self, kind: str, email: str, meta_keys: Optional[Iterable[str]],
+                       loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Resuelve un snapshot en tres niveles: memo de la instancia (request), caché
+        compartida entre requests y, por último, la base de datos (loader).
+        Solo se guardan los resultados exitosos.
+        
+        Args:
+            kind (str): Tipo de snapshot ('structured', 'current_payment_method')
+            email (str): Email del cliente
+            meta_keys: Proyección de metadatos del snapshot
+            loader: Función que consulta la base de datos
+            
+        Returns:
+            Dict con el resultado del snapshot
+        """
+        return self._load_snapshots(kind, [email], meta_keys, lambda emails: {email: loader()})[email]
+    
+    def _load_snapshots(self, kind: str, emails: List[str], meta_keys: Optional[Iterable[str]],
+                        loader: Callable[[List[str]], Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Como _load_snapshot para varios emails: los que no están en el memo ni en la
+        caché se cargan juntos con una sola llamada a loader.
+        
+        Args:
+            kind (str): Tipo de snapshot
+            emails (List[str]): Emails de los clientes
+            meta_keys: Proyección de metadatos del snapshot
+            loader: Función que recibe los emails faltantes y devuelve {email: resultado}
+            
+        Returns:
+            Dict {email: resultado} con todos los emails recibidos
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        # snapshot_key -> (emails con esa clave, grupo, clave de caché, versión)
+        missing: Dict[Tuple, Tuple[List[str], str, str, Optional[str]]] = {}
+        
+        for email in emails:
+            if email in results:
+                continue
+            snapshot_key = self._snapshot_key(kind, email, meta_keys)
+            if snapshot_key in missing:
+                # Mismo email con otras mayúsculas/espacios
+                missing[snapshot_key][0].append(email)
+                continue
+            if snapshot_key in self._snapshots:
+                results[email] = self._snapshots[snapshot_key]
+                continue
+            
+            group = hash_key(snapshot_key[1])
+            cache_key = f"{kind}:{hash_key(repr(snapshot_key[2]))[:16]}"
+            result = self._snapshot_cache.get(group, cache_key)
+            if result is not None:
+                self._snapshots[snapshot_key] = result
+                results[email] = result
+                continue
+            
+            # La versión se toma antes de leer: si hay una escritura entretanto, el
+            # resultado queda guardado bajo una versión ya invalidada
+            missing[snapshot_key] = ([email], group, cache_key, self._snapshot_cache.version(group))
+        
+        if missing:
+            loaded = loader([same_key_emails[0] for same_key_emails, _, _, _ in missing.values()])
+            for snapshot_key, (same_key_emails, group, cache_key, version) in missing.items():
+                result = loaded[same_key_emails[0]]
+                if result['success']:
+                    self._snapshot_cache.set(group, cache_key, result, version=version)
+                    self._stale_snapshot_cache.set(group, cache_key, result)
+                    self._snapshots[snapshot_key] = result
+                elif result.get('error_type') == 'DeadlineExceeded':
+                    # Sin presupuesto para consultar: mejor la última versión conocida que un error
+                    stale_result = self._stale_snapshot_cache.get(group, cache_key)
+                    if stale_result is not None:
+                        logger.warning(f"Presupuesto agotado: sirviendo snapshot '{kind}' desactualizado")
+                        result = {**stale_result, 'stale': True}
+                for email in same_key_emails:
+                    results[email] = result
+        
+        return results
+    
+    def _invalidate_snapshots(self, emails: Iterable[str]):
+        """
+        Descarta los snapshots memoizados y los de la caché compartida de los emails
+        afectados tras una escritura de metadatos, marca sus perfiles de pago locales
+        como desactualizados y abre su ventana read-your-writes.
+        """
+        emails = [email for email in emails if email]
+        self._snapshots.clear()
+        self._mark_written(emails)
+        for email in emails:
+            self._snapshot_cache.invalidate(hash_key(email.strip().lower()))
+        if emails:
+            self._mark_payment_profiles_stale(emails)
+    
+    def _get_order_emails(self, cursor, order_ids: List[int]) -> List[str]:
+        """
+        Emails cuyos snapshots incluyen las órdenes indicadas: el billing_email de cada
+        orden y el de su orden madre (vía los metadatos de enlace).
+        
+        Args:
+            cursor: Cursor abierto sobre la base de datos de WordPress
+            order_ids (List[int]): IDs de las órdenes
+            
+        Returns:
+            Lista de emails sin duplicados
+        """
+        emails = set()
+        link_keys_placeholders = ','.join(['%s'] * len(INSTALLMENT_LINK_META_KEYS))
+        
+        for start in range(0, len(order_ids), METADATA_BATCH_SIZE):
+            chunk = [str(order_id) for order_id in order_ids[start:start + METADATA_BATCH_SIZE]]
+            placeholders = ','.join(['%s'] * len(chunk))
+            query = f"""
+                SELECT o.billing_email
+                FROM wp_wc_orders o
+                WHERE o.id IN ({placeholders})
+                UNION
+                SELECT p.billing_email
+                FROM wp_wc_orders_meta link
+                INNER JOIN wp_wc_orders p ON CAST(p.id AS CHAR) = link.meta_value
+                WHERE link.order_id IN ({placeholders}) AND link.meta_key IN ({link_keys_placeholders})
+            """
+            cursor.execute(query, chunk + chunk + list(INSTALLMENT_LINK_META_KEYS))
+            emails.update(row[0] for row in cursor.fetchall() if row[0])
+        
+        return list(emails)
+    
     def test_connection(self) -> Dict[str, Any]:
         """
-        Prueba la conexión a la base de datos de WordPress.
+        Prueba la conexión de lectura a la base de datos de WordPress
+        (la réplica si está configurada).
         
         Returns:
             Dict con el resultado de la prueba de conexión
         """
         try:
-            connection = self._get_connection()
+            connection = self._get_connection(read_only=True)
             
             with connection.cursor() as cursor:
                 cursor.execute("SELECT 1")
@@ -83,7 +418,8 @@ class WordPressService:
             if 'connection' in locals():
                 connection.close()
     
-    def update_order_meta(self, order_id: int, meta_key: str, meta_value: str) -> Dict[str, Any]:
+    def update_order_meta(self, order_id: int, meta_key: str, meta_value: str,
+                          email: Optional[str] = None) -> Dict[str, Any]:
         """
         Actualiza o inserta un metadato específico de una orden.
         
@@ -91,6 +427,8 @@ class WordPressService:
             order_id (int): ID de la orden
             meta_key (str): Clave del metadato
             meta_value (str): Valor del metadato
+            email (str, opcional): Email del cliente cuyos snapshots en caché se invalidan.
+                Si no se indica, se obtiene de la orden y de su orden madre
             
         Returns:
             Dict con el resultado de la operación
@@ -126,7 +464,9 @@ class WordPressService:
                     cursor.execute(insert_query, (order_id, meta_key, meta_value))
                     operation = 'inserted'
                 
+                affected_emails = [email] if email else self._get_order_emails(cursor, [order_id])
                 connection.commit()
+                self._invalidate_snapshots(affected_emails)
                 
                 return {
                     'success': True,
@@ -151,77 +491,104 @@ class WordPressService:
             if 'connection' in locals():
                 connection.close()
     
-    def get_customer_orders_structured(self, email: str) -> Dict[str, Any]:
+    def bulk_update_order_meta(self, order_ids: List[int], meta_key: str, meta_value: str,
+                               email: Optional[str] = None) -> Dict[str, Any]:
         """
-        Obtiene las órdenes estructuradas de un cliente, priorizando la orden principal más reciente.
+        Actualiza un metadato existente en varias órdenes dentro de una sola transacción.
+        Solo modifica las órdenes que ya tienen el metadato; no inserta entradas nuevas.
         
         Args:
-            email (str): Email del cliente
+            order_ids (List[int]): IDs de las órdenes
+            meta_key (str): Clave del metadato
+            meta_value (str): Nuevo valor del metadato
+            email (str, opcional): Email del cliente cuyos snapshots en caché se invalidan.
+                Si no se indica, se obtienen de las órdenes y de sus órdenes madre
             
         Returns:
-            Dict con las órdenes estructuradas y resumen
+            Dict con el resultado de la operación y las órdenes actualizadas / sin el metadato
         """
+        unique_ids = list(dict.fromkeys(order_ids))
+        
         try:
-            # Obtener órdenes principales ordenadas por ID descendente (más reciente primero)
-            parent_orders = self._get_parent_orders_with_metadata(email)
-            
-            
-            if not parent_orders:
-                return {
-                    'success': True,
-                    'structured_orders': [],
-                    'summary': {
-                        'total_installments': 0,
-                        'parent_orders_count': 0,
-                        'payment_methods': {'stripe': False, 'dlocal': False}
-                    }
-                }
-            
-            structured_orders = []
-            total_installments = 0
-            payment_methods = {'stripe': False, 'dlocal': False}
+            connection = self._get_connection()
             
-            # Procesar cada orden principal (ya ordenadas por fecha DESC)
-            for parent_order in parent_orders:
-                # Obtener cuotas de esta orden principal
-                installments = self._get_installments_with_metadata(parent_order['id'])
-                
-                # Contar cuotas y detectar métodos de pago
-                total_installments += len(installments)
-                
-                for installment in installments:
-                    if installment.get('metadata_dict', {}).get('_stripe_customer_id'):
-                        payment_methods['stripe'] = True
-                    if installment.get('metadata_dict', {}).get('_dlocal_current_subscription_id'):
-                        payment_methods['dlocal'] = True
-                
-                structured_orders.append({
-                    'parent_order': parent_order,
-                    'installments': installments
-                })
+            with connection.cursor() as cursor:
+                updated_set = set(self._lock_and_update_order_meta(cursor, unique_ids, meta_key, meta_value))
+                affected_emails = [email] if email else self._get_order_emails(cursor, unique_ids)
+                connection.commit()
+            self._invalidate_snapshots(affected_emails)
             
             return {
                 'success': True,
-                'structured_orders': structured_orders,
-                'summary': {
-                    'total_installments': total_installments,
-                    'parent_orders_count': len(parent_orders),
-                    'payment_methods': payment_methods
-                }
+                'message': f'Meta {meta_key} actualizado en {len(updated_set)} órdenes',
+                'meta_key': meta_key,
+                'meta_value': meta_value,
+                'updated_order_ids': [order_id for order_id in unique_ids if order_id in updated_set],
+                'missing_order_ids': [order_id for order_id in unique_ids if order_id not in updated_set]
             }
             
         except Exception as e:
-            logger.error(f"Error obteniendo órdenes estructuradas para {email}: {str(e)}")
+            logger.error(f"Error actualizando meta {meta_key} en lote: {str(e)}")
+            if 'connection' in locals():
+                connection.rollback()
             return {
                 'success': False,
                 'error': str(e),
-                'structured_orders': [],
-                'summary': {
-                    'total_installments': 0,
-                    'parent_orders_count': 0,
-                    'payment_methods': {'stripe': False, 'dlocal': False}
-                }
+                'error_type': type(e).__name__,
+                'order_ids': unique_ids
             }
+        finally:
+            if 'connection' in locals():
+                connection.close()
+    
+    def _lock_and_update_order_meta(self, cursor, order_ids: List[int], meta_key: str,
+                                    meta_value: str) -> Dict[int, str]:
+        """
+        Dentro de la transacción del cursor, bloquea (SELECT ... FOR UPDATE) las filas
+        existentes del metadato en las órdenes indicadas y les asigna el nuevo valor,
+        en bloques de METADATA_BATCH_SIZE. El commit queda a cargo del llamador.
+        
+        Args:
+            cursor: Cursor abierto sobre la base de datos primaria de WordPress
+            order_ids (List[int]): IDs de las órdenes, sin duplicados
+            meta_key (str): Clave del metadato
+            meta_value (str): Nuevo valor del metadato
+            
+        Returns:
+            Dict {order_id: valor anterior} de las órdenes que tenían el metadato
+        """
+        previous_values: Dict[int, str] = {}
+        
+        for start in range(0, len(order_ids), METADATA_BATCH_SIZE):
+            chunk = order_ids[start:start + METADATA_BATCH_SIZE]
+            placeholders = ','.join(['%s'] * len(chunk))
+            
+            # Bloquear y obtener las filas existentes
+            select_query = f"""
+                SELECT order_id, meta_value FROM wp_wc_orders_meta
+                WHERE meta_key = %s AND order_id IN ({placeholders})
+                ORDER BY order_id, id
+                FOR UPDATE
+            """
+            cursor.execute(select_query, [meta_key] + chunk)
+            locked_ids = []
+            for order_id, previous_value in cursor.fetchall():
+                if order_id not in previous_values:
+                    locked_ids.append(order_id)
+                previous_values[order_id] = previous_value
+            
+            if not locked_ids:
+                continue
+            
+            placeholders = ','.join(['%s'] * len(locked_ids))
+            update_query = f"""
+                UPDATE wp_wc_orders_meta
+                SET meta_value = %s
+                WHERE meta_key = %s AND order_id IN ({placeholders})
+            """
+            cursor.execute(update_query, [meta_value, meta_key] + locked_ids)
+        
+        return previous_values
     
     def get_customer_payment_methods(self, structured_orders: List[Dict]) -> Dict[str, Any]:
         """
@@ -248,6 +615,20 @@ class WordPressService:
                         latest_processing_installment = installment
                         parent_order_of_latest_installment = structured_order['parent_order']
         
+        return self._resolve_payment_method(latest_processing_installment, parent_order_of_latest_installment)
+
+    def _resolve_payment_method(self, latest_processing_installment: Optional[Dict[str, Any]],
+                                parent_order_of_latest_installment: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Determina el método de pago a partir de la última cuota wc-processing y su orden madre.
+        
+        Args:
+            latest_processing_installment: Cuota con metadata_dict (o None si no hay)
+            parent_order_of_latest_installment: Orden madre con metadata_dict (o None)
+            
+        Returns:
+            Dict con información completa del método de pago del cliente
+        """
         # Determinar método de pago y extraer metadatos relevantes
         payment_method = 'unknown'
         payment_details = {}
@@ -304,250 +685,1132 @@ class WordPressService:
             'has_active_payment': payment_method != 'unknown'
         }
 
-    def _get_parent_orders_with_metadata(self, email: str) -> List[Dict[str, Any]]:
+    def get_current_payment_method(self, email: str,
+                                   meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS,
+                                   for_update: bool = False) -> Dict[str, Any]:
         """
-        Obtiene todas las órdenes principales (asp_shop_plan) del usuario con todos sus metadatos.
+        Ruta rápida para conocer el método de pago actual sin cargar el historial completo.
+        Busca directamente la última cuota wc-processing del cliente y su orden madre
+        (consulta con LIMIT 1) y carga solo los metadatos de esas dos órdenes.
+        El resultado se memoiza y se cachea igual que get_customer_orders_structured.
         
         Args:
             email (str): Email del cliente
+            meta_keys: Proyección de metadatos a cargar (ver PAYMENT_META_KEYS). None = todos
+            for_update (bool): La lectura decide una escritura: se consulta la primaria,
+                sin memo, caché de snapshots ni réplica
             
         Returns:
-            Lista de órdenes principales con metadatos
+            Dict con 'success' y la misma información que get_customer_payment_methods
+        """
+        if for_update:
+            return self._query_current_payment_method(email, meta_keys, primary=True)
+        
+        def loader():
+            # Si ya se cargaron las órdenes completas en este request, derivar de ellas
+            structured_result = self._snapshots.get(self._snapshot_key('structured', email, meta_keys))
+            if structured_result is not None:
+                return {
+                    'success': True,
+                    **self.get_customer_payment_methods(structured_result['structured_orders'])
+                }
+            return self._query_current_payment_method(email, meta_keys)
+        
+        return self._load_snapshot('current_payment_method', email, meta_keys, loader)
+    
+    def _query_current_payment_method(self, email: str, meta_keys: Optional[Iterable[str]],
+                                      primary: bool = False) -> Dict[str, Any]:
+        """
+        Consulta de la ruta rápida de get_current_payment_method (sin memoización).
+        
+        Args:
+            email (str): Email del cliente
+            meta_keys: Proyección de metadatos a cargar. None = todos
+            primary (bool): Leer siempre de la primaria, aunque haya réplica
+            
+        Returns:
+            Dict con 'success' y la misma información que get_customer_payment_methods
         """
         try:
-            connection = self._get_connection()
+            connection = self._get_connection(read_only=not primary, email=email)
             
-            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
-                query = """
-                    SELECT 
-                        o.id,
-                        o.status,
-                        o.date_created_gmt,
-                        o.billing_email,
-                        o.total_amount,
-                        o.payment_method,
-                        o.payment_method_title,
-                        o.type,
-                        GROUP_CONCAT(
-                            CONCAT(om.meta_key, ':', om.meta_value) 
-                            SEPARATOR '||'
-                        ) as metadata
-                    FROM wp_wc_orders o
-                    LEFT JOIN wp_wc_orders_meta om ON o.id = om.order_id
-                    WHERE o.billing_email = %s AND o.type = 'asp_shop_plan'
-                    GROUP BY o.id, o.status, o.date_created_gmt, o.billing_email, o.total_amount, o.payment_method, o.payment_method_title, o.type
-                    ORDER BY o.id DESC, o.date_created_gmt DESC
+            with connection.cursor() as cursor:
+                query = f"""
+                    SELECT {order_select_columns('i')}, p.id AS parent_order_id
+                    FROM wp_wc_orders p
+                    INNER JOIN wp_wc_orders_meta link
+                        ON link.meta_value = CAST(p.id AS CHAR) AND link.meta_key IN (%s, %s)
+                    INNER JOIN wp_wc_orders i ON i.id = link.order_id
+                    WHERE p.billing_email = %s AND p.type = 'asp_shop_plan'
+                      AND i.status = 'wc-processing'
+                    ORDER BY i.date_created_gmt DESC, p.id DESC, i.id ASC
+                    LIMIT 1
                 """
+                cursor.execute(query, INSTALLMENT_LINK_META_KEYS + (email,))
+                row = cursor.fetchone()
                 
-                cursor.execute(query, (email,))
-                orders = cursor.fetchall()
-                
-                # Procesar metadatos - consultando por separado para evitar truncamiento de GROUP_CONCAT
-                for order in orders:
-                    order_id = order['id']
-                    
-                    # Consulta separada para metadatos de esta orden específica
-                    metadata_query = """
-                        SELECT meta_key, meta_value 
-                        FROM wp_wc_orders_meta 
-                        WHERE order_id = %s
-                    """
-                    cursor.execute(metadata_query, (order_id,))
-                    metadata_rows = cursor.fetchall()
-                    
-                    metadata_dict = {}
-                    for row in metadata_rows:
-                        metadata_dict[row['meta_key']] = row['meta_value']
-                    
-                    order['metadata_dict'] = metadata_dict
+                latest_processing_installment = None
+                parent_order = None
+                if row:
+                    parent_order_id = row[len(ORDER_FIELDS)]
+                    latest_processing_installment = Installment.from_row(row, parent_order_id=parent_order_id)
+                    metadata_by_order = self._load_metadata_batch(
+                        cursor, [latest_processing_installment.id, parent_order_id], meta_keys
+                    )
                     
-                return orders
+                    latest_processing_installment.set_metadata(metadata_by_order.get(latest_processing_installment.id, {}))
+                    parent_order = Order(parent_order_id, metadata_dict=metadata_by_order.get(parent_order_id, {}))
                 
+            return {
+                'success': True,
+                **self._resolve_payment_method(latest_processing_installment, parent_order)
+            }
+            
         except Exception as e:
-            logger.error(f"Error obteniendo órdenes principales para {email}: {str(e)}")
-            return []
+            logger.error(f"Error obteniendo método de pago actual para {email}: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'error_type': type(e).__name__,
+                'email': email
+            }
         finally:
             if 'connection' in locals():
                 connection.close()
 
-    def _get_installments_with_metadata(self, parent_order_id: int) -> List[Dict[str, Any]]:
+    def _build_meta_key_filter(self, meta_keys: Optional[Iterable[str]]) -> Tuple[str, List[str]]:
         """
-        Obtiene todas las cuotas (shop_order) asociadas a una orden madre usando la relación
-        correcta vía la tabla de metadatos:
-        1. Primero se buscan en wp_wc_orders_meta los registros donde meta_key = '_asp_upp_schedule_payment'
-           y meta_value = parent_order_id. Cada registro retornado representa una cuota y su order_id es
-           el ID de la cuota.
-        2. Con esa lista de IDs se consultan los datos base en wp_wc_orders.
-        3. Se ordenan por el meta '_asp_upp_payment_number' (numérico ascendente).
+        Construye el filtro SQL de una proyección de metadatos.
         
         Args:
-            parent_order_id (int): ID de la orden principal
+            meta_keys: Claves a cargar; las terminadas en '*' son prefijos. None = todas
             
         Returns:
-            Lista de cuotas ordenadas por _asp_upp_payment_number
+            Tupla (condición SQL con placeholders, parámetros); condición vacía si no hay proyección
         """
-        try:
-            connection = self._get_connection()
-            
-            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
-                # 1. Obtener IDs de cuotas asociadas a la orden madre incluyendo:
-                #    - _asp_upp_initial_payment (primer pago)
-                #    - _asp_upp_schedule_payment (resto de cuotas)
-                installments_ids_query = """
-                    SELECT DISTINCT order_id 
-                    FROM wp_wc_orders_meta 
-                    WHERE meta_value = %s AND meta_key IN ('_asp_upp_initial_payment','_asp_upp_schedule_payment')
-                """
-                cursor.execute(installments_ids_query, (parent_order_id,))
-                rows = cursor.fetchall()
-                installment_ids = list({r['order_id'] for r in rows})  # eliminar duplicados si existieran
-
-                if not installment_ids:
-                    return []
-
-                # 2. Obtener datos base de las cuotas
-                # Usamos IN (%s,...). Para evitar problemas con lista vacía ya retornamos antes.
-                placeholders = ','.join(['%s'] * len(installment_ids))
-                base_query = f"""
-                    SELECT 
-                        o.id,
-                        o.status,
-                        o.date_created_gmt,
-                        o.billing_email,
-                        o.total_amount,
-                        o.payment_method,
-                        o.payment_method_title,
-                        o.type
-                    FROM wp_wc_orders o
-                    WHERE o.id IN ({placeholders})
-                """
-                cursor.execute(base_query, installment_ids)
-                installments = cursor.fetchall()
-
-                # 3. Enriquecer con metadatos y calcular payment_number
-                for installment in installments:
-                    order_id = installment['id']
-
-                    metadata_query = """
-                        SELECT meta_key, meta_value
-                        FROM wp_wc_orders_meta
-                        WHERE order_id = %s
-                    """
-                    cursor.execute(metadata_query, (order_id,))
-                    metadata_rows = cursor.fetchall()
-
-                    metadata_dict = {}
-                    for row in metadata_rows:
-                        metadata_dict[row['meta_key']] = row['meta_value']
-
-                    installment['metadata_dict'] = metadata_dict
-                    try:
-                        installment['payment_number'] = int(metadata_dict.get('_asp_upp_payment_number', 0))
-                    except ValueError:
-                        installment['payment_number'] = 0
-
-                # 4. Ordenar en memoria por payment_number (asc)
-                installments.sort(key=lambda x: x.get('payment_number', 0))
+        if meta_keys is None:
+            return '', []
+        
+        exact_keys = []
+        prefix_patterns = []
+        for key in meta_keys:
+            if key.endswith('*'):
+                # '!' como carácter de escape: '_' y '%' son comodines en LIKE
+                prefix = key[:-1].replace('!', '!!').replace('_', '!_').replace('%', '!%')
+                prefix_patterns.append(prefix + '%')
+            else:
+                exact_keys.append(key)
+        
+        conditions = []
+        if exact_keys:
+            conditions.append(f"meta_key IN ({','.join(['%s'] * len(exact_keys))})")
+        conditions.extend("meta_key LIKE %s ESCAPE '!'" for _ in prefix_patterns)
+        if not conditions:
+            # Proyección vacía: no cargar ningún metadato
+            return ' AND 1 = 0', []
+        
+        return f" AND ({' OR '.join(conditions)})", exact_keys + prefix_patterns
 
-                # Log eliminado (antes detallaba cuotas recuperadas)
+    def _load_metadata_batch(self, cursor, order_ids: List[int],
+                             meta_keys: Optional[Iterable[str]] = None) -> Dict[int, Dict[str, str]]:
+        """
+        Carga los metadatos de varias órdenes con consultas IN (...) en bloques
+        de METADATA_BATCH_SIZE y los agrupa por orden en memoria.
+        
+        Args:
+            cursor: Cursor abierto (de tuplas) sobre la base de datos de WordPress
+            order_ids (List[int]): IDs de las órdenes
+            meta_keys: Proyección de claves a cargar (ver PAYMENT_META_KEYS). None = todas
+            
+        Returns:
+            Dict {order_id: {meta_key: meta_value}}; las órdenes sin metadatos no aparecen.
+            Las claves se internan: son las mismas pocas en todas las órdenes
+        """
+        metadata_by_order: Dict[int, Dict[str, str]] = {}
+        unique_ids = list(dict.fromkeys(order_ids))
+        key_filter, key_params = self._build_meta_key_filter(meta_keys)
+        if key_filter and not key_params:
+            # Proyección vacía: no hay nada que consultar
+            return metadata_by_order
+        
+        for start in range(0, len(unique_ids), METADATA_BATCH_SIZE):
+            chunk = unique_ids[start:start + METADATA_BATCH_SIZE]
+            placeholders = ','.join(['%s'] * len(chunk))
+            metadata_query = f"""
+                SELECT order_id, meta_key, meta_value
+                FROM wp_wc_orders_meta
+                WHERE order_id IN ({placeholders}){key_filter}
+                ORDER BY order_id, id
+            """
+            cursor.execute(metadata_query, chunk + key_params)
+            for order_id, meta_key, meta_value in cursor.fetchall():
+                metadata_by_order.setdefault(order_id, {})[sys.intern(meta_key)] = meta_value
+        
+        return metadata_by_order
 
-                return installments
-                
+    def _load_installments_by_parent(self, cursor, parent_ids: List[int],
+                                     use_installment_links: bool = True) -> Dict[int, List[Installment]]:
+        """
+        Carga los datos base de las cuotas de varias órdenes madre, agrupadas por madre.
+        Si la tabla local InstallmentLink está fresca y coincide con WordPress para una
+        madre, su relación se lee de la tabla y las cuotas se buscan por ID; el resto de
+        las madres se resuelve con los metadatos de enlace (INSTALLMENT_LINK_META_KEYS)
+        unidos a wp_wc_orders.
+        
+        Args:
+            cursor: Cursor abierto (de tuplas) sobre la base de datos de WordPress
+            parent_ids (List[int]): IDs de las órdenes madre
+            use_installment_links (bool): Permitir usar la tabla local InstallmentLink;
+                las lecturas que deciden una escritura pasan False
+            
+        Returns:
+            Dict {parent_id: [cuotas]}; cada cuota con su parent_order_id, sin metadatos
+        """
+        installments_by_parent: Dict[int, List[Installment]] = {parent_id: [] for parent_id in parent_ids}
+        
+        parents_to_resolve = list(installments_by_parent)
+        if use_installment_links:
+            links, parents_to_resolve = self._get_fresh_installment_links(cursor, parents_to_resolve)
+            if links:
+                installment_ids = [installment_id for _, installment_id in links]
+                rows_by_id = {row[0]: row for row in self._load_order_rows_by_id(cursor, installment_ids)}
+                for parent_id, installment_id in links:
+                    row = rows_by_id.get(installment_id)
+                    if row is None:
+                        # La cuota ya no existe en WordPress
+                        continue
+                    installments_by_parent[parent_id].append(Installment.from_row(row, parent_order_id=parent_id))
+        
+        # meta_value es texto: se compara contra los IDs como string para poder usar índices.
+        parent_id_strings = [str(parent_id) for parent_id in parents_to_resolve]
+        link_keys_placeholders = ','.join(['%s'] * len(INSTALLMENT_LINK_META_KEYS))
+        seen = set()
+        
+        for start in range(0, len(parent_id_strings), METADATA_BATCH_SIZE):
+            chunk = parent_id_strings[start:start + METADATA_BATCH_SIZE]
+            placeholders = ','.join(['%s'] * len(chunk))
+            installments_query = f"""
+                SELECT {order_select_columns('o')}, link.meta_value AS parent_order_id
+                FROM wp_wc_orders_meta link
+                INNER JOIN wp_wc_orders o ON o.id = link.order_id
+                WHERE link.meta_key IN ({link_keys_placeholders})
+                  AND link.meta_value IN ({placeholders})
+            """
+            cursor.execute(installments_query, list(INSTALLMENT_LINK_META_KEYS) + chunk)
+            
+            for row in cursor.fetchall():
+                try:
+                    parent_id = int(row[len(ORDER_FIELDS)])
+                except (TypeError, ValueError):
+                    continue
+                # Una cuota puede tener ambos metadatos de enlace hacia la misma madre
+                if (parent_id, row[0]) in seen or parent_id not in installments_by_parent:
+                    continue
+                seen.add((parent_id, row[0]))
+                installments_by_parent[parent_id].append(Installment.from_row(row, parent_order_id=parent_id))
+        
+        return installments_by_parent
+    
+    def _load_order_rows_by_id(self, cursor, order_ids: List[int]) -> List[tuple]:
+        """
+        Carga los datos base (filas con ORDER_FIELDS) de varias órdenes por ID, en
+        bloques de METADATA_BATCH_SIZE.
+        """
+        rows = []
+        unique_ids = list(dict.fromkeys(order_ids))
+        
+        for start in range(0, len(unique_ids), METADATA_BATCH_SIZE):
+            chunk = unique_ids[start:start + METADATA_BATCH_SIZE]
+            placeholders = ','.join(['%s'] * len(chunk))
+            query = f"""
+                SELECT {order_select_columns('o')}
+                FROM wp_wc_orders o
+                WHERE o.id IN ({placeholders})
+            """
+            cursor.execute(query, chunk)
+            rows.extend(cursor.fetchall())
+        
+        return rows
+    
+    def _get_fresh_installment_links(self, cursor, parent_ids: List[int]) -> Tuple[List[Tuple[int, int]], List[int]]:
+        """
+        Relación madre → cuota desde la tabla local InstallmentLink, solo si la última
+        sincronización es más reciente que WORDPRESS_INSTALLMENT_LINKS_MAX_STALENESS y
+        ninguna orden modificada en WordPress después de la marca de agua toca la madre:
+        ni enlazada a ella ahora ni enlazada a ella en la tabla. Así las cuotas creadas o
+        desenlazadas después de la última sincronización no quedan fuera.
+        
+        Args:
+            cursor: Cursor abierto (de tuplas) sobre la base de datos de WordPress
+            parent_ids (List[int]): IDs de las órdenes madre
+            
+        Returns:
+            Tupla (lista de (parent_id, installment_id) de las madres verificadas, IDs de
+            las madres que hay que resolver con los metadatos de WordPress)
+        """
+        max_staleness = getattr(settings, 'WORDPRESS_INSTALLMENT_LINKS_MAX_STALENESS', 600)
+        if not max_staleness or not parent_ids:
+            return [], parent_ids
+        
+        try:
+            from core.models import InstallmentLink, SyncState
+            
+            state = SyncState.objects.filter(name=INSTALLMENT_LINKS_SYNC_NAME).first()
+            if state is None or state.last_synced_at is None:
+                return [], parent_ids
+            if timezone.now() - state.last_synced_at > timedelta(seconds=max_staleness):
+                return [], parent_ids
+            
+            local_links = list(
+                InstallmentLink.objects
+                .filter(parent_id__in=parent_ids)
+                .order_by('parent_id', 'payment_number')
+                .values_list('parent_id', 'installment_id')
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo usar la tabla local de cuotas: {str(e)}")
+            return [], parent_ids
+        
+        changed_links = self._get_installment_links_changed_since(cursor, state)
+        if changed_links is None:
+            logger.info("Demasiadas órdenes modificadas desde la última sincronización de la tabla "
+                        "local de cuotas; se leen de los metadatos de WordPress")
+            return [], parent_ids
+        
+        requested = set(parent_ids)
+        outdated_ids = set()
+        for linked_parents in changed_links.values():
+            outdated_ids.update(linked_parents & requested)
+        outdated_ids.update(parent_id for parent_id, installment_id in local_links if installment_id in changed_links)
+        
+        outdated = [parent_id for parent_id in parent_ids if parent_id in outdated_ids]
+        if outdated:
+            logger.info(f"Tabla local de cuotas desactualizada para {len(outdated)} órdenes madre; "
+                        f"se leen de los metadatos de WordPress")
+        
+        return [link for link in local_links if link[0] not in outdated_ids], outdated
+    
+    def _get_installment_links_changed_since(self, cursor, state) -> Optional[Dict[int, Set[int]]]:
+        """
+        Órdenes modificadas en WordPress después de la marca de agua de state, con las
+        madres a las que las enlazan hoy sus metadatos de enlace. Recorre wp_wc_orders por
+        (date_updated_gmt, id), como la sincronización, y une los metadatos por order_id:
+        no busca por meta_value.
+        
+        Returns:
+            Dict {order_id: {parent_id, ...}} (vacío si la orden no está enlazada), o None
+            si hay más de METADATA_BATCH_SIZE órdenes modificadas
+        """
+        link_keys_placeholders = ','.join(['%s'] * len(INSTALLMENT_LINK_META_KEYS))
+        row_limit = METADATA_BATCH_SIZE * len(INSTALLMENT_LINK_META_KEYS) + 1
+        since = self._high_water_mark_as_naive_utc(state)
+        
+        cursor.execute(f"""
+            SELECT o.id, link.meta_value
+            FROM wp_wc_orders o
+            LEFT JOIN wp_wc_orders_meta link
+              ON link.order_id = o.id AND link.meta_key IN ({link_keys_placeholders})
+            WHERE o.date_updated_gmt IS NOT NULL
+              AND (o.date_updated_gmt > %s OR (o.date_updated_gmt = %s AND o.id > %s))
+            ORDER BY o.date_updated_gmt, o.id
+            LIMIT %s
+        """, list(INSTALLMENT_LINK_META_KEYS) + [since, since, state.high_water_mark_id, row_limit])
+        rows = cursor.fetchall()
+        if len(rows) >= row_limit:
+            return None
+        
+        changed_links: Dict[int, Set[int]] = {}
+        for order_id, parent_id in rows:
+            linked_parents = changed_links.setdefault(order_id, set())
+            try:
+                linked_parents.add(int(parent_id))
+            except (TypeError, ValueError):
+                continue
+        return changed_links
+    
+    def sync_installment_links(self, batch_size: int = 1000, full: bool = False) -> Dict[str, Any]:
+        """
+        Sincroniza de forma incremental la tabla local InstallmentLink con WordPress.
+        Solo procesa las órdenes con date_updated_gmt posterior a la marca de agua de la
+        última ejecución, recorridas por (date_updated_gmt, id) en lotes.
+        
+        Args:
+            batch_size (int): Órdenes por lote
+            full (bool): Ignorar la marca de agua y recorrer todas las órdenes
+            
+        Returns:
+            Dict con el resultado de la sincronización
+        """
+        from core.models import InstallmentLink, SyncState
+        
+        try:
+            state, _ = SyncState.objects.get_or_create(name=INSTALLMENT_LINKS_SYNC_NAME)
+            if full:
+                state.high_water_mark = None
+                state.high_water_mark_id = 0
+            
+            connection = self._get_connection(read_only=True)
+            processed_orders = 0
+            synced_links = 0
+            
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor, connection.cursor() as meta_cursor:
+                for orders in self._iter_changed_orders(cursor, state, batch_size):
+                    # Metadatos de enlace y número de cuota de las órdenes del lote
+                    metadata_by_order = self._load_metadata_batch(
+                        meta_cursor, [order['id'] for order in orders],
+                        INSTALLMENT_LINK_META_KEYS + ('_asp_upp_payment_number',)
+                    )
+                    
+                    links = []
+                    for order in orders:
+                        metadata_dict = metadata_by_order.get(order['id'], {})
+                        payment_number = parse_payment_number(metadata_dict)
+                        
+                        parent_ids = set()
+                        for link_key in INSTALLMENT_LINK_META_KEYS:
+                            try:
+                                parent_ids.add(int(metadata_dict[link_key]))
+                            except (KeyError, TypeError, ValueError):
+                                continue
+                        
+                        for parent_id in parent_ids:
+                            links.append(InstallmentLink(
+                                parent_id=parent_id,
+                                installment_id=order['id'],
+                                payment_number=payment_number,
+                                status=order['status'] or '',
+                                date_created_gmt=self._to_aware_utc(order['date_created_gmt'])
+                            ))
+                    
+                    with transaction.atomic():
+                        if links:
+                            InstallmentLink.objects.bulk_create(
+                                links,
+                                update_conflicts=True,
+                                unique_fields=['parent_id', 'installment_id'],
+                                update_fields=['payment_number', 'status', 'date_created_gmt']
+                            )
+                        self._advance_high_water_mark(state, orders[-1])
+                    
+                    processed_orders += len(orders)
+                    synced_links += len(links)
+            
+            state.last_synced_at = timezone.now()
+            state.save(update_fields=['last_synced_at'])
+            
+            return {
+                'success': True,
+                'message': f'Sincronizadas {synced_links} cuotas de {processed_orders} órdenes modificadas',
+                'processed_orders': processed_orders,
+                'synced_links': synced_links,
+                'high_water_mark': state.high_water_mark
+            }
+            
         except Exception as e:
-            logger.error(f"Error obteniendo cuotas para orden {parent_order_id}: {str(e)}")
-            return []
+            logger.error(f"Error sincronizando tabla local de cuotas: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'error_type': type(e).__name__
+            }
         finally:
             if 'connection' in locals():
                 connection.close()
-
-    def get_customer_orders_structured(self, email: str) -> Dict[str, Any]:
+    
+    def sync_customer_payment_profiles(self, batch_size: int = 500, full: bool = False) -> Dict[str, Any]:
         """
-        Método centralizado para obtener órdenes estructuradas: orden madre → cuotas.
+        Sincroniza de forma incremental la tabla local CustomerPaymentProfile con WordPress.
+        Reconstruye el perfil de cada cliente con alguna orden (propia o cuota de uno de
+        sus planes) modificada desde la marca de agua, y el de los perfiles marcados como
+        desactualizados por una escritura desde la aplicación.
         
         Args:
-            email (str): Email del cliente
+            batch_size (int): Órdenes modificadas por lote
+            full (bool): Ignorar la marca de agua y recorrer todas las órdenes
             
         Returns:
-            Dict con órdenes estructuradas y resumen
+            Dict con el resultado de la sincronización
         """
+        from core.models import CustomerPaymentProfile, SyncState
+        
         try:
-            # Obtener órdenes principales
-            parent_orders = self._get_parent_orders_with_metadata(email)
+            state, _ = SyncState.objects.get_or_create(name=PAYMENT_PROFILES_SYNC_NAME)
+            if full:
+                state.high_water_mark = None
+                state.high_water_mark_id = 0
             
-            structured_orders = []
-            all_installments = []
-            payment_methods = {'stripe': False, 'dlocal': False, 'other': False}
+            connection = self._get_connection(read_only=True)
+            processed_orders = 0
+            synced_emails = set()
+            failed_emails = set()
             
-            for parent_order in parent_orders:
-                # Obtener cuotas de esta orden principal
-                installments = self._get_installments_with_metadata(parent_order['id'])
-                
-                # Clasificar métodos de pago basado en metadatos
-                for installment in installments:
-                    all_installments.append(installment)
-                    metadata = installment['metadata_dict']
-                    
-                    # Detectar métodos de pago por metadatos
-                    has_stripe = any(key.startswith('_stripe_') for key in metadata.keys())
-                    has_dlocal = any(key.startswith('_dlocal_') for key in metadata.keys())
-                    
-                    if has_stripe:
-                        payment_methods['stripe'] = True
-                    elif has_dlocal:
-                        payment_methods['dlocal'] = True
-                    else:
-                        payment_methods['other'] = True
-                
-                structured_orders.append({
-                    'parent_order': parent_order,
-                    'installments': installments,
-                    'installments_count': len(installments)
-                })
-            
-            # Determinar método de pago principal
-            primary_payment_method = 'unknown'
-            if payment_methods['dlocal']:
-                primary_payment_method = 'dlocal'
-            elif payment_methods['stripe']:
-                primary_payment_method = 'stripe'
-            elif payment_methods['other']:
-                primary_payment_method = 'other'
+            def sync_emails(emails):
+                pending = list(dict.fromkeys(
+                    normalized_email for normalized_email in (email.strip().lower() for email in emails)
+                    if normalized_email not in synced_emails
+                ))
+                for start in range(0, len(pending), METADATA_BATCH_SIZE):
+                    chunk = pending[start:start + METADATA_BATCH_SIZE]
+                    # Versiones de las marcas de desactualizado antes de leer WordPress
+                    stale_versions = dict(
+                        CustomerPaymentProfile.objects.filter(email__in=chunk).values_list('email', 'stale_version')
+                    )
+                    # Órdenes de todo el bloque de clientes con consultas por conjuntos
+                    structured_results = self._build_customers_orders_structured(chunk, PAYMENT_META_KEYS)
+                    for email in chunk:
+                        if self._sync_customer_payment_profile(email, structured_results[email], stale_versions.get(email)):
+                            synced_emails.add(email)
+                            failed_emails.discard(email)
+                        else:
+                            # La marca de agua avanza igual: el perfil queda desactualizado para reintentarlo
+                            failed_emails.add(email)
+                            self._mark_payment_profiles_stale([email])
+            
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                for orders in self._iter_changed_orders(cursor, state, batch_size):
+                    with connection.cursor() as email_cursor:
+                        emails = self._get_order_emails(email_cursor, [order['id'] for order in orders])
+                    sync_emails(emails)
+                    self._advance_high_water_mark(state, orders[-1])
+                    processed_orders += len(orders)
+            
+            sync_emails(CustomerPaymentProfile.objects.filter(stale=True).values_list('email', flat=True))
+            
+            state.last_synced_at = timezone.now()
+            state.save(update_fields=['last_synced_at'])
             
             return {
                 'success': True,
-                'email': email,
-                'structured_orders': structured_orders,
-                'summary': {
-                    'parent_orders_count': len(parent_orders),
-                    'total_installments': len(all_installments),
-                    'payment_methods': payment_methods,
-                    'primary_payment_method': primary_payment_method
-                }
+                'message': f'Sincronizados {len(synced_emails)} clientes de {processed_orders} órdenes modificadas',
+                'processed_orders': processed_orders,
+                'synced_count': len(synced_emails),
+                'failed_emails': sorted(failed_emails),
+                'high_water_mark': state.high_water_mark
             }
             
         except Exception as e:
-            logger.error(f"Error obteniendo órdenes estructuradas para {email}: {str(e)}")
+            logger.error(f"Error sincronizando perfiles de pago: {str(e)}")
             return {
                 'success': False,
                 'error': str(e),
-                'error_type': type(e).__name__,
-                'email': email
+                'error_type': type(e).__name__
             }
+        finally:
+            if 'connection' in locals():
+                connection.close()
     
+    def _sync_customer_payment_profile(self, email: str, structured_result: Dict[str, Any],
+                                       stale_version: Optional[int]) -> bool:
+        """
+        Reconstruye el perfil de pago local de un cliente (o lo borra si ya no tiene
+        órdenes) a partir de sus órdenes estructuradas. La escritura es condicional a
+        stale_version: si una escritura desde la aplicación marcó el perfil como
+        desactualizado mientras se leía WordPress, los datos leídos pueden ser anteriores
+        a ella y el perfil no se toca.
+        
+        Args:
+            email (str): Email del cliente
+            structured_result: Resultado de _build_customers_orders_structured para el email
+            stale_version: stale_version del perfil antes de leer WordPress (None si no existía)
+        
+        Returns:
+            True si el perfil quedó sincronizado
+        """
+        from core.models import CustomerPaymentProfile
+        
+        normalized_email = email.strip().lower()
+        if not structured_result['success']:
+            return False
+        
+        structured_orders = structured_result['structured_orders']
+        if not structured_orders:
+            if stale_version is not None:
+                CustomerPaymentProfile.objects.filter(email=normalized_email, stale_version=stale_version).delete()
+            return True
+        
+        payment_info = self.get_customer_payment_methods(structured_orders)
+        payment_details = payment_info['payment_details']
+        latest_installment = payment_info['latest_processing_installment']
+        summary = structured_result['summary']
+        
+        # Misma regla que las vistas: cuota siguiente a la última wc-processing en su plan
+        next_installment = next_installment_after(structured_result, latest_installment)
+        
+        profile_fields = {
+            'payment_method': payment_info['payment_method'],
+            'stripe_customer_id': payment_details.get('customer_id') or '',
+            'stripe_source_id': payment_details.get('source_id') or '',
+            'dlocal_plan_id': payment_details.get('current_plan_id') or '',
+            'dlocal_subscription_id': payment_details.get('current_subscription_id') or '',
+            'parent_order_id': payment_info['latest_processing_parent_order_id'],
+            'latest_installment_id': latest_installment['id'] if latest_installment else None,
+            'latest_installment_payment_number': latest_installment.get('payment_number', 0) if latest_installment else None,
+            'latest_installment_date': self._to_aware_utc(latest_installment['date_created_gmt']) if latest_installment else None,
+            'next_installment_id': next_installment['id'] if next_installment else None,
+            'next_installment_amount': next_installment['total_amount'] if next_installment else None,
+            'parent_orders_count': summary['parent_orders_count'],
+            'total_installments': summary['total_installments'],
+            'has_stripe': summary['payment_methods']['stripe'],
+            'has_dlocal': summary['payment_methods']['dlocal'],
+            'stale': False,
+            'synced_at': timezone.now()
+        }
+        
+        if stale_version is None:
+            try:
+                with transaction.atomic():
+                    CustomerPaymentProfile.objects.create(email=normalized_email, **profile_fields)
+            except IntegrityError:
+                # Otra escritura creó el perfil mientras se leía WordPress
+                return False
+            return True
+        
+        updated = CustomerPaymentProfile.objects.filter(
+            email=normalized_email, stale_version=stale_version
+        ).update(**profile_fields)
+        return updated > 0
+    
+    def get_customer_payment_profile(self, email: str) -> Optional[Dict[str, Any]]:
+        """
+        Estado de pago del cliente leído de la tabla local CustomerPaymentProfile, con la
+        misma forma que get_current_payment_method más 'summary' y 'next_installment'.
+        
+        Solo se usa si la última sincronización es más reciente que
+        WORDPRESS_PAYMENT_PROFILE_MAX_STALENESS, el perfil no fue invalidado por una
+        escritura y el cliente no está en su ventana read-your-writes.
+        
+        Args:
+            email (str): Email del cliente
+            
+        Returns:
+            Dict con el estado de pago, o None si hay que consultar WordPress
+        """
+        max_staleness = getattr(settings, 'WORDPRESS_PAYMENT_PROFILE_MAX_STALENESS', 600)
+        if not max_staleness or self._recently_written(email):
+            return None
+        
+        try:
+            from core.models import CustomerPaymentProfile, SyncState
+            
+            state = SyncState.objects.filter(name=PAYMENT_PROFILES_SYNC_NAME).first()
+            if state is None or state.last_synced_at is None:
+                return None
+            if timezone.now() - state.last_synced_at > timedelta(seconds=max_staleness):
+                return None
+            
+            profile = CustomerPaymentProfile.objects.filter(
+                email=email.strip().lower(), stale=False
+            ).first()
+        except Exception as e:
+            logger.warning(f"No se pudo leer el perfil de pago local: {str(e)}")
+            return None
+        
+        if profile is None:
+            return None
+        
+        if profile.payment_method == 'stripe':
+            payment_details = {
+                'customer_id': profile.stripe_customer_id or None,
+                'source_id': profile.stripe_source_id or None
+            }
+        elif profile.payment_method == 'dlocal':
+            payment_details = {
+                'current_plan_id': profile.dlocal_plan_id or None,
+                'current_subscription_id': profile.dlocal_subscription_id or None
+            }
+        else:
+            payment_details = {}
+        
+        latest_installment = None
+        if profile.latest_installment_id:
+            latest_installment = {
+                'id': profile.latest_installment_id,
+                'status': 'wc-processing',
+                'date_created_gmt': profile.latest_installment_date,
+                'payment_number': profile.latest_installment_payment_number,
+                'parent_order_id': profile.parent_order_id
+            }
+        
+        next_installment = None
+        if profile.next_installment_id:
+            next_installment = {
+                'id': profile.next_installment_id,
+                'payment_number': (profile.latest_installment_payment_number or 0) + 1,
+                'total_amount': profile.next_installment_amount
+            }
+        
+        return {
+            'success': True,
+            'payment_method': profile.payment_method,
+            'payment_details': payment_details,
+            'latest_processing_installment': latest_installment,
+            'latest_processing_parent_order_id': profile.parent_order_id,
+            'has_active_payment': profile.payment_method != 'unknown',
+            'next_installment': next_installment,
+            'summary': {
+                'parent_orders_count': profile.parent_orders_count,
+                'total_installments': profile.total_installments,
+                'payment_methods': {'stripe': profile.has_stripe, 'dlocal': profile.has_dlocal}
+            }
+        }
+    
+    def _mark_payment_profiles_stale(self, emails: Iterable[str]):
+        """
+        Marca como desactualizados los perfiles de pago locales de los emails; la próxima
+        sincronización los reconstruye y, mientras tanto, se consulta WordPress. Los
+        emails sin perfil reciben uno vacío ya marcado, para que una sincronización que
+        esté leyendo WordPress en este momento no lo cree con datos anteriores.
+        """
+        try:
+            from core.models import CustomerPaymentProfile
+            
+            normalized_emails = list(dict.fromkeys(email.strip().lower() for email in emails))
+            CustomerPaymentProfile.objects.filter(email__in=normalized_emails).update(
+                stale=True, stale_version=F('stale_version') + 1
+            )
+            now = timezone.now()
+            CustomerPaymentProfile.objects.bulk_create(
+                [
+                    CustomerPaymentProfile(email=email, payment_method='unknown', stale=True,
+                                           stale_version=1, synced_at=now)
+                    for email in normalized_emails
+                ],
+                ignore_conflicts=True
+            )
+        except Exception as e:
+            logger.warning(f"No se pudieron invalidar los perfiles de pago locales: {str(e)}")
+    
+    def _iter_changed_orders(self, cursor, state, batch_size: int):
+        """
+        Recorre por lotes las órdenes con date_updated_gmt posterior a la marca de agua
+        de state, ordenadas por (date_updated_gmt, id). Quien consume cada lote debe
+        avanzar la marca con _advance_high_water_mark() antes de pedir el siguiente.
+        
+        Args:
+            cursor: Cursor abierto (DictCursor) sobre la base de datos de WordPress
+            state: SyncState de la sincronización
+            batch_size (int): Órdenes por lote
+            
+        Yields:
+            Listas de órdenes (id, status, date_created_gmt, date_updated_gmt)
+        """
+        changed_query = """
+            SELECT o.id, o.status, o.date_created_gmt, o.date_updated_gmt
+            FROM wp_wc_orders o
+            WHERE o.date_updated_gmt IS NOT NULL
+              AND (o.date_updated_gmt > %s OR (o.date_updated_gmt = %s AND o.id > %s))
+            ORDER BY o.date_updated_gmt, o.id
+            LIMIT %s
+        """
+        while True:
+            since = self._high_water_mark_as_naive_utc(state)
+            cursor.execute(changed_query, (since, since, state.high_water_mark_id, batch_size))
+            orders = cursor.fetchall()
+            if not orders:
+                return
+            
+            yield orders
+            
+            if len(orders) < batch_size:
+                return
+    
+    def _high_water_mark_as_naive_utc(self, state) -> datetime:
+        """
+        Marca de agua de state como fecha UTC sin zona, para comparar con las columnas *_gmt.
+        """
+        since = state.high_water_mark or datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+        return since.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    
+    def _advance_high_water_mark(self, state, last_order: Dict[str, Any]):
+        state.high_water_mark = self._to_aware_utc(last_order['date_updated_gmt'])
+        state.high_water_mark_id = last_order['id']
+        state.save(update_fields=['high_water_mark', 'high_water_mark_id'])
+    
+    def _to_aware_utc(self, value):
+        """
+        Las fechas *_gmt de WordPress llegan sin zona horaria; se marcan como UTC.
+        """
+        if value is None or timezone.is_aware(value):
+            return value
+        return timezone.make_aware(value, dt_timezone.utc)
+    
+    def _get_customers_order_graphs(self, emails: List[str],
+                                    meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Carga los grafos orden madre → cuotas → metadatos de varios clientes con consultas
+        por conjuntos, sin importar cuántos clientes, órdenes y cuotas haya:
+        1. Órdenes madre (asp_shop_plan) de los emails (billing_email IN (...), en bloques).
+        2. Cuotas de todas esas órdenes madre, resueltas vía la tabla local InstallmentLink
+           si está fresca o, si no, vía los metadatos de enlace unidos a wp_wc_orders.
+        3. Metadatos de todas las órdenes (madre y cuotas) en lote.
+        
+        Args:
+            emails (List[str]): Emails de los clientes
+            meta_keys: Proyección de metadatos a cargar (ver PAYMENT_META_KEYS). None = todos
+            
+        Returns:
+            Dict {email normalizado: [{'parent_order': ..., 'installments': [...]}]}; los
+            emails sin órdenes no aparecen
+            
+        Raises:
+            Exception: Los errores de base de datos se propagan al llamador
+        """
+        unique_emails = list(dict.fromkeys(email.strip().lower() for email in emails if email))
+        if not unique_emails:
+            return {}
+        
+        # Si alguno escribió hace poco, todo el lote se lee de la primaria
+        read_only = not any(self._recently_written(email) for email in unique_emails)
+        connection = self._get_connection(read_only=read_only)
+        try:
+            with connection.cursor() as cursor:
+                return self._load_order_graphs(cursor, unique_emails, meta_keys)
+        finally:
+            connection.close()
+    
+    def _load_order_graphs(self, cursor, emails: List[str], meta_keys: Optional[Iterable[str]],
+                           use_installment_links: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Consultas de _get_customers_order_graphs sobre un cursor ya abierto, para poder
+        leer dentro de la transacción de una escritura.
+        
+        Args:
+            cursor: Cursor abierto (de tuplas) sobre la base de datos de WordPress
+            emails (List[str]): Emails normalizados (strip + lower) y sin duplicados
+            meta_keys: Proyección de metadatos a cargar. None = todos
+            use_installment_links (bool): Permitir resolver las cuotas con la tabla local
+                InstallmentLink; las lecturas que deciden una escritura pasan False
+            
+        Returns:
+            Dict {email normalizado: [{'parent_order': ..., 'installments': [...]}]}
+        """
+        # 1. Órdenes madre
+        parent_orders = []
+        for start in range(0, len(emails), METADATA_BATCH_SIZE):
+            chunk = emails[start:start + METADATA_BATCH_SIZE]
+            placeholders = ','.join(['%s'] * len(chunk))
+            parents_query = f"""
+                SELECT {order_select_columns('o')}
+                FROM wp_wc_orders o
+                WHERE o.billing_email IN ({placeholders}) AND o.type = 'asp_shop_plan'
+                ORDER BY o.id DESC, o.date_created_gmt DESC
+            """
+            cursor.execute(parents_query, chunk)
+            parent_orders.extend(Order.from_row(row) for row in cursor.fetchall())
+        
+        if not parent_orders:
+            return {}
+        
+        # 2. Cuotas de todas las órdenes madre con sus datos base
+        installments_by_parent = self._load_installments_by_parent(
+            cursor, [order.id for order in parent_orders], use_installment_links=use_installment_links
+        )
+        
+        # 3. Metadatos de madres y cuotas en lote
+        order_ids = [order.id for order in parent_orders]
+        for installments in installments_by_parent.values():
+            order_ids.extend(installment.id for installment in installments)
+        metadata_by_order = self._load_metadata_batch(cursor, order_ids, meta_keys)
+        
+        graphs: Dict[str, List[Dict[str, Any]]] = {}
+        for parent_order in parent_orders:
+            parent_order.metadata_dict = metadata_by_order.get(parent_order.id, {})
+            
+            installments = installments_by_parent[parent_order.id]
+            for installment in installments:
+                installment.set_metadata(metadata_by_order.get(installment.id, {}))
+            installments.sort(key=lambda x: x.payment_number)
+            
+            graphs.setdefault((parent_order.billing_email or '').strip().lower(), []).append({
+                'parent_order': parent_order,
+                'installments': installments
+            })
+        
+        return graphs
 
-    def get_customer_orders_summary(self, email: str) -> Dict[str, Any]:
+    def get_customer_orders_structured(self, email: str,
+                                       meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS) -> Dict[str, Any]:
+        """
+        Método centralizado para obtener órdenes estructuradas: orden madre → cuotas.
+        Las llamadas repetidas con el mismo email en la misma instancia reutilizan el
+        primer resultado hasta la siguiente escritura de metadatos, y entre requests se
+        sirve desde la caché de snapshots (WORDPRESS_SNAPSHOT_CACHE_TTL).
+        
+        Args:
+            email (str): Email del cliente
+            meta_keys: Proyección de metadatos a cargar. Por defecto solo las claves que
+                usa la resolución del método de pago (PAYMENT_META_KEYS); None = todos
+            
+        Returns:
+            Dict con órdenes estructuradas y resumen
+        """
+        return self._load_snapshot(
+            'structured', email, meta_keys,
+            lambda: self._build_customer_orders_structured(email, meta_keys)
+        )
+    
+    def get_customers_orders_structured(self, emails: Iterable[str],
+                                        meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS) -> Dict[str, Dict[str, Any]]:
+        """
+        Versión por lotes de get_customer_orders_structured para herramientas de soporte y
+        conciliación: los emails que no están memoizados ni en la caché de snapshots se
+        resuelven juntos con consultas por conjuntos (billing_email IN (...), en bloques),
+        en lugar de unas pocas consultas por email.
+        
+        Args:
+            emails: Emails de los clientes
+            meta_keys: Proyección de metadatos a cargar (ver get_customer_orders_structured)
+            
+        Returns:
+            Dict {email: resultado}, con un resultado por email recibido y la misma forma
+            (órdenes estructuradas y resumen) que get_customer_orders_structured
+        """
+        return self._load_snapshots(
+            'structured', list(emails), meta_keys,
+            lambda missing_emails: self._build_customers_orders_structured(missing_emails, meta_keys)
+        )
+    
+    def _build_customer_orders_structured(self, email: str, meta_keys: Optional[Iterable[str]]) -> Dict[str, Any]:
+        """
+        Construye el resultado de get_customer_orders_structured (sin memoización).
+        
+        Args:
+            email (str): Email del cliente
+            meta_keys: Proyección de metadatos a cargar. None = todos
+            
+        Returns:
+            Dict con órdenes estructuradas y resumen
+        """
+        return self._build_customers_orders_structured([email], meta_keys)[email]
+    
+    def _build_customers_orders_structured(self, emails: List[str],
+                                           meta_keys: Optional[Iterable[str]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Construye los resultados de get_customers_orders_structured (sin memoización).
+        
+        Args:
+            emails (List[str]): Emails de los clientes
+            meta_keys: Proyección de metadatos a cargar. None = todos
+            
+        Returns:
+            Dict {email: resultado}; si falla la consulta, todos los emails llevan el error
+        """
+        try:
+            # Grafos completos madre → cuotas → metadatos en un número fijo de consultas
+            graphs = self._get_customers_order_graphs(emails, meta_keys)
+        except Exception as e:
+            logger.error(f"Error obteniendo órdenes estructuradas para {', '.join(emails[:5])}"
+                         f"{'...' if len(emails) > 5 else ''}: {str(e)}")
+            return {
+                email: {
+                    'success': False,
+                    'error': str(e),
+                    'error_type': type(e).__name__,
+                    'email': email
+                }
+                for email in emails
+            }
+        
+        return {
+            email: self._structure_customer_orders(email, graphs.get(email.strip().lower(), []))
+            for email in emails
+        }
+    
+    def _structure_customer_orders(self, email: str, order_graph: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Arma el resultado de get_customer_orders_structured a partir del grafo de un cliente.
+        """
+        structured_orders = []
+        all_installments = []
+        installment_index = {}
+        payment_methods = {'stripe': False, 'dlocal': False, 'other': False}
+        
+        for order_group in order_graph:
+            parent_order = order_group['parent_order']
+            installments = order_group['installments']
+            
+            # Clasificar métodos de pago basado en metadatos
+            for installment in installments:
+                all_installments.append(installment)
+                # Si un número se repite dentro del plan, gana la primera cuota (orden por payment_number)
+                installment_index.setdefault((parent_order['id'], installment['payment_number']), installment)
+                metadata = installment['metadata_dict']
+                
+                # Detectar métodos de pago por metadatos (solo las claves que los identifican)
+                has_stripe = any(key in metadata for key in STRIPE_META_KEYS)
+                has_dlocal = any(key in metadata for key in DLOCAL_META_KEYS)
+                
+                if has_stripe:
+                    payment_methods['stripe'] = True
+                elif has_dlocal:
+                    payment_methods['dlocal'] = True
+                else:
+                    payment_methods['other'] = True
+            
+            structured_orders.append({
+                'parent_order': parent_order,
+                'installments': installments,
+                'installments_count': len(installments)
+            })
+        
+        # Determinar método de pago principal
+        primary_payment_method = 'unknown'
+        if payment_methods['dlocal']:
+            primary_payment_method = 'dlocal'
+        elif payment_methods['stripe']:
+            primary_payment_method = 'stripe'
+        elif payment_methods['other']:
+            primary_payment_method = 'other'
+        
+        return {
+            'success': True,
+            'email': email,
+            'structured_orders': structured_orders,
+            # (parent_order_id, payment_number) -> cuota, para next_installment_after
+            'installment_index': installment_index,
+            'summary': {
+                'parent_orders_count': len(structured_orders),
+                'total_installments': len(all_installments),
+                'payment_methods': payment_methods,
+                'primary_payment_method': primary_payment_method
+            }
+        }
+    
+    def count_plan_orders(self, after_parent_id: int = 0) -> int:
+        """
+        Cantidad de órdenes madre (asp_shop_plan) con ID mayor que after_parent_id.
+        """
+        connection = self._get_connection(read_only=True)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM wp_wc_orders WHERE type = 'asp_shop_plan' AND id > %s",
+                    (after_parent_id,)
+                )
+                return cursor.fetchone()[0]
+        finally:
+            connection.close()
+    
+    def iter_payment_states(self, after_parent_id: int = 0, batch_size: int = 500,
+                            meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS):
+        """
+        Recorre todas las órdenes madre (asp_shop_plan) por ID ascendente y produce, por
+        lotes, el estado de pago de cada plan. Las órdenes madre se leen con un cursor del
+        lado del servidor (SSCursor) sin cargar el resultado completo en memoria; las cuotas
+        y los metadatos de cada lote se consultan por otra conexión.
+        
+        Args:
+            after_parent_id (int): Empezar después de esta orden madre (para reanudar)
+            batch_size (int): Órdenes madre por lote
+            meta_keys: Proyección de metadatos a cargar (ver PAYMENT_META_KEYS)
+            
+        Yields:
+            Listas de dicts con PAYMENT_STATE_FIELDS, en orden de parent_order_id
+            
+        Raises:
+            Exception: Los errores de base de datos se propagan al llamador
+        """
+        stream_connection = self._get_connection(read_only=True)
+        lookup_connection = None
+        try:
+            lookup_connection = self._get_connection(read_only=True)
+            with stream_connection.cursor(pymysql.cursors.SSCursor) as stream, lookup_connection.cursor() as cursor:
+                stream.execute(f"""
+                    SELECT {order_select_columns('o')}
+                    FROM wp_wc_orders o
+                    WHERE o.type = 'asp_shop_plan' AND o.id > %s
+                    ORDER BY o.id
+                """, (after_parent_id,))
+                
+                while True:
+                    rows = stream.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    
+                    parent_orders = [Order.from_row(row) for row in rows]
+                    installments_by_parent = self._load_installments_by_parent(
+                        cursor, [order.id for order in parent_orders]
+                    )
+                    
+                    order_ids = [order.id for order in parent_orders]
+                    for installments in installments_by_parent.values():
+                        order_ids.extend(installment.id for installment in installments)
+                    metadata_by_order = self._load_metadata_batch(cursor, order_ids, meta_keys)
+                    
+                    states = []
+                    for parent_order in parent_orders:
+                        parent_order.metadata_dict = metadata_by_order.get(parent_order.id, {})
+                        installments = installments_by_parent[parent_order.id]
+                        for installment in installments:
+                            installment.set_metadata(metadata_by_order.get(installment.id, {}))
+                        installments.sort(key=lambda x: x.payment_number)
+                        states.append(self._build_payment_state(parent_order, installments))
+                    
+                    yield states
+        finally:
+            # Cerrar el cursor SSCursor consume las filas pendientes antes de devolver la conexión
+            stream_connection.close()
+            if lookup_connection is not None:
+                lookup_connection.close()
+    
+    def _build_payment_state(self, parent_order: Order, installments: List[Installment]) -> Dict[str, Any]:
+        """
+        Estado de pago de un plan, con la misma regla que get_customer_payment_methods
+        aplicada solo a sus cuotas. stale_source_id_installments cuenta las cuotas cuyo
+        _stripe_source_id difiere del de la última cuota wc-processing.
+        """
+        payment_info = self.get_customer_payment_methods([
+            {'parent_order': parent_order, 'installments': installments}
+        ])
+        payment_details = payment_info['payment_details']
+        latest_installment = payment_info['latest_processing_installment']
+        
+        current_source_id = payment_details.get('source_id')
+        source_ids = {
+            installment.metadata_dict['_stripe_source_id']
+            for installment in installments
+            if installment.metadata_dict.get('_stripe_source_id')
+        }
+        stale_source_id_installments = 0
+        if current_source_id:
+            stale_source_id_installments = sum(
+                1 for installment in installments
+                if installment.metadata_dict.get('_stripe_source_id') not in (None, '', current_source_id)
+            )
+        
+        return {
+            'email': parent_order.billing_email,
+            'parent_order_id': parent_order.id,
+            'parent_status': parent_order.status,
+            'parent_date_created_gmt': parent_order.date_created_gmt.isoformat() if parent_order.date_created_gmt else None,
+            'installments_count': len(installments),
+            'processing_installments_count': sum(1 for installment in installments if installment.status == 'wc-processing'),
+            'latest_processing_installment_id': latest_installment.id if latest_installment else None,
+            'latest_payment_number': latest_installment.payment_number if latest_installment else None,
+            'payment_method': payment_info['payment_method'],
+            'stripe_customer_id': payment_details.get('customer_id'),
+            'stripe_source_id': current_source_id,
+            'dlocal_plan_id': payment_details.get('current_plan_id'),
+            'dlocal_subscription_id': payment_details.get('current_subscription_id'),
+            'distinct_source_ids': len(source_ids),
+            'stale_source_id_installments': stale_source_id_installments
+        }
+    
+    def get_customer_orders_summary(self, email: str,
+                                    meta_keys: Optional[Iterable[str]] = PAYMENT_META_KEYS) -> Dict[str, Any]:
         """
         Obtiene un resumen completo de las órdenes de un cliente usando el enfoque estructurado.
         
         Args:
             email (str): Email del cliente
+            meta_keys: Proyección de metadatos a cargar (ver PAYMENT_META_KEYS). None = todos
             
         Returns:
             Dict con el resumen de órdenes del cliente
         """
         try:
             # Usar el nuevo método estructurado
-            structured_result = self.get_customer_orders_structured(email)
+            structured_result = self.get_customer_orders_structured(email, meta_keys)
             if not structured_result['success']:
                 return structured_result
             
@@ -583,6 +1846,10 @@ class WordPressService:
         Actualiza el _stripe_source_id solo para las cuotas que ya lo tengan.
         No inserta el metadato si no existe, solo actualiza los existentes.
         
+        Las órdenes a modificar se leen en la primaria dentro de la misma transacción
+        que la actualización, sin memo, caché de snapshots, réplica ni tabla local de
+        cuotas: una lectura desactualizada dejaría cuotas con la tarjeta anterior.
+        
         Args:
             email (str): Email del cliente
             new_payment_method_id (str): Nuevo payment method ID de Stripe
@@ -590,94 +1857,50 @@ class WordPressService:
         Returns:
             Dict con el resultado de la operación
         """
+        normalized_email = email.strip().lower()
+        
         try:
-            # Obtener órdenes estructuradas del cliente
-            structured_result = self.get_customer_orders_structured(email)
-            if not structured_result['success']:
-                return {
-                    'success': False,
-                    'error': 'No se pudieron obtener las órdenes del cliente',
-                    'details': structured_result.get('error', 'Error desconocido')
-                }
-            
-            updated_orders = []
-            skipped_orders = []
+            connection = self._get_connection()
             
-            # Recorrer todas las órdenes estructuradas
-            for order_group in structured_result['structured_orders']:
-                parent_order = order_group['parent_order']
-                installments = order_group['installments']
+            with connection.cursor() as cursor:
+                order_graph = self._load_order_graphs(
+                    cursor, [normalized_email], (), use_installment_links=False
+                ).get(normalized_email, [])
                 
-                # PRIMERO: Procesar la orden padre
-                parent_order_id = parent_order['id']
-                parent_metadata = parent_order.get('metadata_dict', {})
+                # Candidatas en el orden de procesamiento: primero la orden padre y luego sus
+                # cuotas por ID ascendente. Solo se actualizan las que ya tienen _stripe_source_id.
+                candidates = []
+                for order_group in order_graph:
+                    candidates.append((order_group['parent_order'], 'parent'))
+                    sorted_installments = sorted(order_group['installments'], key=lambda x: x['id'])
+                    candidates.extend((installment, 'installment') for installment in sorted_installments)
                 
-                # Actualizar la orden padre solo si ya tiene _stripe_source_id
-                if '_stripe_source_id' in parent_metadata:
-                    current_source_id = parent_metadata.get('_stripe_source_id')
-                    
-                    update_result = self.update_order_meta(
-                        order_id=parent_order_id,
-                        meta_key='_stripe_source_id',
-                        meta_value=new_payment_method_id
-                    )
-                    
-                    if update_result['success']:
-                        updated_orders.append({
-                            'order_id': parent_order_id,
-                            'order_type': 'parent',
-                            'old_source_id': current_source_id,
-                            'new_source_id': new_payment_method_id
-                        })
-                    else:
-                        skipped_orders.append({
-                            'order_id': parent_order_id,
-                            'order_type': 'parent',
-                            'reason': f"Error actualizando: {update_result.get('error', 'Error desconocido')}"
-                        })
+                previous_source_ids = self._lock_and_update_order_meta(
+                    cursor, list(dict.fromkeys(order['id'] for order, _ in candidates)),
+                    '_stripe_source_id', new_payment_method_id
+                )
+                connection.commit()
+            
+            if previous_source_ids:
+                self._invalidate_snapshots([email])
+            
+            updated_orders = []
+            skipped_orders = []
+            for order, order_type in candidates:
+                order_id = order['id']
+                if order_id in previous_source_ids:
+                    updated_orders.append({
+                        'order_id': order_id,
+                        'order_type': order_type,
+                        'old_source_id': previous_source_ids[order_id],
+                        'new_source_id': new_payment_method_id
+                    })
                 else:
                     skipped_orders.append({
-                        'order_id': parent_order_id,
-                        'order_type': 'parent',
+                        'order_id': order_id,
+                        'order_type': order_type,
                         'reason': 'No tiene _stripe_source_id existente'
                     })
-                
-                # SEGUNDO: Procesar cuotas (installments) - ordenadas por ID ascendente para empezar desde la primera
-                sorted_installments = sorted(installments, key=lambda x: x['id'])
-                
-                for installment in sorted_installments:
-                    order_id = installment['id']
-                    metadata = installment.get('metadata_dict', {})
-                    
-                    # Solo actualizar si ya tiene _stripe_source_id
-                    if '_stripe_source_id' in metadata:
-                        current_source_id = metadata.get('_stripe_source_id')
-                        
-                        update_result = self.update_order_meta(
-                            order_id=order_id,
-                            meta_key='_stripe_source_id',
-                            meta_value=new_payment_method_id
-                        )
-                        
-                        if update_result['success']:
-                            updated_orders.append({
-                                'order_id': order_id,
-                                'order_type': 'installment',
-                                'old_source_id': current_source_id,
-                                'new_source_id': new_payment_method_id
-                            })
-                        else:
-                            skipped_orders.append({
-                                'order_id': order_id,
-                                'order_type': 'installment',
-                                'reason': f"Error actualizando: {update_result.get('error', 'Error desconocido')}"
-                            })
-                    else:
-                        skipped_orders.append({
-                            'order_id': order_id,
-                            'order_type': 'installment',
-                            'reason': 'No tiene _stripe_source_id existente'
-                        })
             
             return {
                 'success': True,
@@ -695,9 +1918,14 @@ class WordPressService:
             
         except Exception as e:
             logger.error(f"Error actualizando _stripe_source_id para {email}: {str(e)}")
+            if 'connection' in locals():
+                connection.rollback()
             return {
                 'success': False,
                 'error': str(e),
                 'error_type': type(e).__name__,
                 'email': email
-            }
\ No newline at end of file
+            }
+        finally:
+            if 'connection' in locals():
+                connection.close()